@@ -0,0 +1,123 @@
+from array import array
+
+
+class ParseTree:
+    """
+    Parse tree stored in an arena of parallel arrays instead of one object per node.
+
+    Every node is an integer index into the arrays. Leaf nodes are input symbols, with formula index -1;
+    inner nodes are reductions, with the index of the reduced formula in grammar's formula list.
+    Children of a node are linked through 'first_child' and 'sibling', -1 means no such node.
+    Every node covers input symbols in [start, end).
+    """
+    def __init__(self, grammar, tokens):
+        """
+        :param grammar: Grammar object, used to find formulas of inner nodes.
+        :param tokens: list, containing Mask objects of the input series, without the ending '#'.
+        """
+        self.grammar = grammar
+        self.tokens = tokens
+        self.formula = array('i')
+        self.first_child = array('i')
+        self.sibling = array('i')
+        self.start = array('i')
+        self.end = array('i')
+        self.root = -1
+
+    def __len__(self):
+        return len(self.formula)
+
+    def add_leaf(self, pos):
+        """
+        Add a leaf node for one input symbol.
+
+        :param pos: int, position of the symbol in input series.
+        :return: int, index of the new node.
+        """
+        self.formula.append(-1)
+        self.first_child.append(-1)
+        self.sibling.append(-1)
+        self.start.append(pos)
+        self.end.append(pos + 1)
+        return len(self.formula) - 1
+
+    def add_node(self, formula_index, children):
+        """
+        Add an inner node for one reduction.
+
+        :param formula_index: int, index of the reduced formula in grammar's formula list.
+        :param children: list, containing indexes of children nodes from left to right.
+        :return: int, index of the new node.
+        """
+        for left, right in zip(children, children[1:]):
+            self.sibling[left] = right
+        self.formula.append(formula_index)
+        self.first_child.append(children[0] if len(children) > 0 else -1)
+        self.sibling.append(-1)
+        self.start.append(self.start[children[0]] if len(children) > 0 else 0)
+        self.end.append(self.end[children[-1]] if len(children) > 0 else 0)
+        return len(self.formula) - 1
+
+    def is_leaf(self, node):
+        return self.formula[node] == -1
+
+    def get_symbol(self, node):
+        """
+        :param node: int, node index.
+        :return: str, terminal symbol of a leaf node, or non-terminal symbol of an inner node.
+        """
+        if self.is_leaf(node):
+            return self.tokens[self.start[node]].outer
+        return self.grammar.formula_list[self.formula[node]][0]
+
+    def get_text(self, node):
+        """
+        :param node: int, node index of a leaf node.
+        :return: str, inner presentation of the input symbol like 'a' or '10', or outer one like '+'.
+        """
+        token = self.tokens[self.start[node]]
+        return token.inner if len(token.inner) > 0 else token.outer
+
+    def get_span(self, node):
+        """
+        :param node: int, node index.
+        :return: tuple, (start, end) positions of input symbols covered by the node.
+        """
+        return self.start[node], self.end[node]
+
+    def get_children(self, node):
+        """
+        :param node: int, node index.
+        :return: list, containing indexes of children nodes from left to right.
+        """
+        result = []
+        child = self.first_child[node]
+        while child != -1:
+            result.append(child)
+            child = self.sibling[child]
+        return result
+
+    def to_tuple(self, node=None):
+        """
+        Convert the tree into nested tuples, like ('A', ('V', 'a'), '=', ('E', ...)).
+        Leaf nodes are converted to their text, inner nodes to (symbol, children...).
+
+        :param node: int, index of the node to start from. Use root if not given.
+        :return: nested tuples, or str if node is a leaf.
+        """
+        if node is None:
+            node = self.root
+        # Convert in post order without recursion, left-recursive formulas can make the tree very deep.
+        converted = dict()
+        stack = [(node, False)]
+        while len(stack) > 0:
+            current, expanded = stack.pop()
+            if self.is_leaf(current):
+                converted[current] = self.get_text(current)
+            elif expanded:
+                children = self.get_children(current)
+                converted[current] = (self.get_symbol(current),) + tuple(converted.pop(c) for c in children)
+            else:
+                stack.append((current, True))
+                stack.extend((c, False) for c in self.get_children(current))
+        return converted[node]
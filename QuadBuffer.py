@@ -0,0 +1,140 @@
+import struct
+import sys
+from array import array
+
+# Magic bytes and version at the beginning of binary quaternary files.
+MAGIC = b'QUAD'
+VERSION = 1
+
+
+def to_little_endian(column):
+    """
+    :param column: array object.
+    :return: array object, in little endian byte order.
+    """
+    if sys.byteorder == 'big':
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column
+
+
+def format_quat(quat):
+    """
+    :param quat: tuple, operator and three operands as str, '_' for empty operand.
+    :return: str, text form of the quaternary formula like '(+,a,b,T1)'.
+    """
+    return '({},{},{},{})'.format(*quat)
+
+
+class QuadBuffer:
+    """
+    Quaternary formulas stored column-wise.
+
+    Operators and operands are interned in one string table, every quaternary formula is four integer
+    references into the table, stored in four typed arrays. Operands are kept as they appear in text form,
+    so '_' stands for an empty operand.
+    """
+    def __init__(self):
+        # String table, and its reverse dict in 'string -> index' format.
+        self.strings = []
+        self.string_index = dict()
+
+        self.op = array('i')
+        self.arg1 = array('i')
+        self.arg2 = array('i')
+        self.result = array('i')
+
+    def __len__(self):
+        return len(self.op)
+
+    def __getitem__(self, i):
+        return (self.strings[self.op[i]], self.strings[self.arg1[i]],
+                self.strings[self.arg2[i]], self.strings[self.result[i]])
+
+    def __iter__(self):
+        strings = self.strings
+        for op, arg1, arg2, result in zip(self.op, self.arg1, self.arg2, self.result):
+            yield strings[op], strings[arg1], strings[arg2], strings[result]
+
+    def intern(self, string):
+        """
+        :param string: str, operator or operand.
+        :return: int, index of the string in string table.
+        """
+        index = self.string_index.get(string)
+        if index is None:
+            index = len(self.strings)
+            self.strings.append(string)
+            self.string_index[string] = index
+        return index
+
+    def append(self, op, arg1, arg2, result):
+        """
+        Append one quaternary formula.
+
+        :param op: str, operator like '+' or '='.
+        :param arg1: str, first operand, '_' if empty.
+        :param arg2: str, second operand, '_' if empty.
+        :param result: str, result operand.
+        """
+        self.op.append(self.intern(op))
+        self.arg1.append(self.intern(arg1))
+        self.arg2.append(self.intern(arg2))
+        self.result.append(self.intern(result))
+
+    def clear(self):
+        self.__init__()
+
+    def write_text(self, file):
+        """
+        Write all quaternary formulas in text form like '(+,a,b,T1)', one per line.
+
+        :param file: file object opened in text mode.
+        """
+        for quat in self:
+            file.write(format_quat(quat) + '\n')
+
+    def write_binary(self, file):
+        """
+        Write all quaternary formulas in compact binary form.
+        The file contains a header, the string table, then the four columns, all in little endian.
+
+        :param file: file object opened in binary mode.
+        """
+        encoded = [string.encode() for string in self.strings]
+        file.write(MAGIC)
+        file.write(struct.pack('<III', VERSION, len(encoded), len(self.op)))
+        to_little_endian(array('i', [len(string) for string in encoded])).tofile(file)
+        file.write(b''.join(encoded))
+        for column in (self.op, self.arg1, self.arg2, self.result):
+            to_little_endian(column).tofile(file)
+
+    @classmethod
+    def read_binary(cls, file):
+        """
+        Read quaternary formulas written by write_binary.
+
+        :param file: file object opened in binary mode.
+        :return: QuadBuffer object.
+        :raise: ValueError when the file is not a binary quaternary file.
+        """
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a binary quaternary file.")
+        version, string_count, count = struct.unpack('<III', file.read(12))
+        if version != VERSION:
+            raise ValueError("Unsupported binary quaternary file version {}.".format(version))
+        buffer = cls()
+        lengths = array('i')
+        lengths.fromfile(file, string_count)
+        if sys.byteorder == 'big':
+            lengths.byteswap()
+        data = file.read(sum(lengths))
+        pos = 0
+        for length in lengths:
+            buffer.intern(data[pos:pos + length].decode())
+            pos += length
+        for column in (buffer.op, buffer.arg1, buffer.arg2, buffer.result):
+            column.fromfile(file, count)
+            if sys.byteorder == 'big':
+                column.byteswap()
+        return buffer
@@ -1,5 +1,9 @@
 from SLRMap import SLRMap
 from grammar import get_formula_type, FormulaType
+from ParseTree import ParseTree
+from SLRTrace import TraceRow, CallbackTraceSink
+from SLRShortcuts import SLRShortcuts
+from QuadBuffer import format_quat
 
 
 class Mask:
@@ -46,6 +50,19 @@ def str2masks(input_series):
     return result
 
 
+def get_quat(symbol, s1, s2, s3):
+    """
+    Get operator and operands of one quaternary formula.
+
+    :param symbol: Mask object
+    :param s1: Mask object
+    :param s2: Mask object
+    :param s3: Mask object
+    :return: tuple, containing operator and three operands as str, '_' for empty operand.
+    """
+    return (symbol.outer,) + tuple('_' if len(s.outer) == 0 else s.inner for s in [s1, s2, s3])
+
+
 def gen(symbol, s1, s2, s3):
     """
     Generate one quaternary formula.
@@ -55,70 +72,116 @@ def gen(symbol, s1, s2, s3):
     :param s2: Mask object
     :param s3: Mask object
     """
-    result = '(' + symbol.outer
-    for s in [s1, s2, s3]:
-        result += ','
-        if len(s.outer) == 0:
-            result += '_'
-        else:
-            result += s.inner
-    result += ')'
-    return result
+    return format_quat(get_quat(symbol, s1, s2, s3))
 
 
 class SLRAn(SLRMap):
     """
     SLR analyzer.
     """
-    def __init__(self, grammar):
-        SLRMap.__init__(self, grammar)
+    def __init__(self, grammar, lean=False, lazy=False, eliminate_units=False):
+        SLRMap.__init__(self, grammar, lean, lazy=lazy, eliminate_units=eliminate_units)
 
         self.step = 0
         self.temp_num = 0
 
-    def analysis(self, input_series):
+        # Integer tables and shortcuts used by fast_analysis, constructed on first use.
+        self.shortcuts = None
+
+    def edit_grammar(self, non_t, formula, add):
         """
-        Use SLR to analysis input series.
+        Same as SLRMap.edit_grammar, dropping shortcuts built on the old map.
+        """
+        self.shortcuts = None
+        return SLRMap.edit_grammar(self, non_t, formula, add)
+
+    def fast_analysis(self, input_series, quads=None, verify=False):
+        """
+        Analysis input series on integer tables with precomputed shortcuts, see SLRShortcuts.
+        Gives the same result and quaternary formulas as analysis, but no trace or parse tree.
 
         :param input_series: list, containing symbols of input series, which items are Mask objects.
-        :raise: ValueError when current state and input symbol don't match any action in analysis map.
+            Unlike analysis, the list is not changed.
+        :param quads: QuadBuffer object, generated quaternary formulas are appended to it
+            only if the input series is valid.
+        :param verify: bool, also run analysis on the input series, and compare acceptance, failing position,
+            and quaternary formulas of valid input series.
+        :raise: ValueError when the input series is invalid.
+        :raise: RuntimeError when verify is set and the results are different.
         """
-        global step_str, symbol_stack_str, state_stack_str, input_series_str, action_str, quat_str
-        step_str, symbol_stack_str, state_stack_str, input_series_str, action_str, quat_str = [], [], [], [], [], []
+        if verify:
+            rows = []
+            try:
+                self.analysis(list(input_series), trace=CallbackTraceSink(rows.append))
+                expected_pos = -1
+            except (ValueError, KeyError, IndexError):
+                expected_pos = len([row for row in rows if row.action.startswith('S')])
+            expected_quats = [row.quat for row in rows if len(row.quat) > 0]
+
+        stats = self.grammar.stats
+        stats.begin_parse()
+        with stats.phase('fast_analysis'):
+            if self.shortcuts is None:
+                self.shortcuts = SLRShortcuts(self)
+            quats = []
+            fail_pos, message = self.fast_parse(input_series, quats)
+
+        if verify:
+            if fail_pos != expected_pos:
+                raise RuntimeError("Fast analysis fails at {}, but analysis fails at {}.".format(
+                    fail_pos, expected_pos))
+            if fail_pos < 0 and [format_quat(quat) for quat in quats] != expected_quats:
+                raise RuntimeError("Fast analysis generates different quaternary formulas from analysis.")
+        if fail_pos >= 0:
+            raise ValueError(message)
+        if quads is not None:
+            for quat in quats:
+                quads.append(*quat)
+
+    def fast_parse(self, input_series, quats):
+        """
+        The parse loop of fast_analysis.
+
+        :param input_series: list, containing symbols of input series, which items are Mask objects.
+        :param quats: list, generated quaternary formulas are appended to it as tuples.
+        :return: tuple, (failing position in input series, error message), (-1, '') if the input series is valid.
+        """
+        shortcuts = self.shortcuts
+        action_table, goto_table = shortcuts.action, shortcuts.goto
+        formulas, forced, lookahead = shortcuts.formulas, shortcuts.forced, shortcuts.lookahead
+        symbol_index, unknown_index = shortcuts.symbol_index, shortcuts.unknown_index
+        codes = [symbol_index.get(symbol.outer, unknown_index) for symbol in input_series] + [shortcuts.end_index]
+        input_series = list(input_series) + [Mask('', '#')]
 
-        self.step = 0
         self.temp_num = 0
+        shifts = reductions = forced_reductions = chained = 0
         symbol_stack = [Mask('', '#')]
         state_stack = [0]
-        input_series.append(Mask('', '#'))
-
-        while True:
-            # Get the top of state stack and its corresponding project set.
-            top_state_num = state_stack[-1]
-
-            # Pop in the first symbol of input series.
-            input_symbol = input_series[0]
-
-            action = self.get_action(top_state_num, input_symbol.outer)
-            if action == 'Acc':
-                action = 'R0'
-            if len(action) == 0:
-                self.print_stack(symbol_stack, state_stack, input_series, action, '', True)
-                raise ValueError("Current state {} and input symbol {} don't match any action in analysis map."
-                                 .format(top_state_num, input_symbol.outer))
-            if action[0] == 'S':
-                self.print_stack(symbol_stack, state_stack, input_series, action)
-
-                symbol_stack.append(input_symbol)
-                del input_series[0]
-                state_stack.append(int(action[1:]))
-            if action[0] == 'R':
-                formula = self.grammar.formula_list[int(action[1:])]
-                formula_length = len(formula[1].split(' '))
+        pos = 0
+        try:
+            while True:
+                state = state_stack[-1]
+                formula_index = forced[state]
+                if formula_index < 0 or not lookahead[state] >> codes[pos] & 1:
+                    code = action_table[state][codes[pos]]
+                    if code > 0:
+                        shifts += 1
+                        state_stack.append(code - 1)
+                        symbol_stack.append(input_series[pos])
+                        pos += 1
+                        continue
+                    if code == 0:
+                        return pos, "Current state {} and input symbol {} don't match any action in analysis map." \
+                            .format(state, input_series[pos].outer)
+                    formula_index = 0 if code == -1 else -code - 2
+                else:
+                    forced_reductions += 1
 
+                reductions += 1
+                non_t, non_t_index, formula_length, formula_type = formulas[formula_index]
+                if formula_length >= len(state_stack):
+                    return pos, "Reduction of formula {} pops the whole stack.".format(formula_index)
                 non_t_inner = ''
-                quat = ''
-                formula_type = get_formula_type(formula[1])
                 if formula_type == FormulaType.ENTRY or formula_type == FormulaType.SINGLE:
                     non_t_inner = symbol_stack[-1].inner
                 elif formula_type == FormulaType.BRACKET:
@@ -126,24 +189,176 @@ class SLRAn(SLRMap):
                 elif formula_type == FormulaType.BIN:
                     self.temp_num += 1
                     temp = Mask('T{}'.format(self.temp_num), 'i')
-                    quat = gen(symbol_stack[-2], symbol_stack[-3], symbol_stack[-1], temp)
+                    quats.append(get_quat(symbol_stack[-2], symbol_stack[-3], symbol_stack[-1], temp))
                     non_t_inner = temp.inner
                 elif formula_type == FormulaType.EQUAL:
-                    quat = gen(symbol_stack[-2], symbol_stack[-1], Mask('', ''), symbol_stack[-3])
-
-                self.print_stack(symbol_stack, state_stack, input_series, action, quat)
+                    quats.append(get_quat(symbol_stack[-2], symbol_stack[-1], Mask('', ''), symbol_stack[-3]))
 
                 del state_stack[-formula_length:]
                 del symbol_stack[-formula_length:]
+                if formula_index == 0 and codes[pos] == shortcuts.end_index:
+                    return -1, ''
+
+                goto = goto_table[state_stack[-1]][non_t_index]
+                if goto is None:
+                    return pos, "Current state {} has no goto on {}.".format(state_stack[-1], non_t)
+                # Chained one-symbol reductions only pass the value through.
+                state, chained_non_t, count, mask = goto
+                if mask >> codes[pos] & 1:
+                    non_t = chained_non_t
+                else:
+                    # Some chained reduction isn't reduced on the input symbol, stop at the first state.
+                    state = action_table[state_stack[-1]][non_t_index] - 1
+                    count = 0
+                reductions += count
+                chained += count
+                state_stack.append(state)
+                symbol_stack.append(Mask(non_t_inner, non_t))
+        finally:
+            stats = self.grammar.stats
+            stats.incr_parse('shifts', shifts)
+            stats.incr_parse('reductions', reductions)
+            stats.incr_parse('forced_reductions', forced_reductions)
+            stats.incr_parse('chained_reductions', chained)
+            stats.incr_parse('temps', self.temp_num)
+            stats.incr_parse('quads', len(quats))
 
-                if int(action[1:]) == 0 and input_symbol.outer == '#':
-                    self.print_stack(symbol_stack, state_stack, input_series, 'Acc', '', True)
-                    return
+    def analysis(self, input_series, build_tree=False, trace=None, quads=None):
+        """
+        Use SLR to analysis input series.
+
+        :param input_series: list, containing symbols of input series, which items are Mask objects.
+        :param build_tree: bool, build a parse tree during reductions or not.
+        :param trace: TraceSink object, receiving every step as soon as it is done.
+            If not given, the whole trace is printed out at the end of analysis.
+        :param quads: QuadBuffer object, generated quaternary formulas are appended to it
+            only if the input series is valid.
+        :return: ParseTree object if build_tree is set to true, else None.
+        :raise: ValueError when current state and input symbol don't match any action in analysis map.
+        """
+        global step_str, symbol_stack_str, state_stack_str, input_series_str, action_str, quat_str
+        step_str, symbol_stack_str, state_stack_str, input_series_str, action_str, quat_str = [], [], [], [], [], []
+
+        stats = self.grammar.stats
+        stats.begin_parse()
+        with stats.phase('analysis'):
+            self.step = 0
+            self.temp_num = 0
+            symbol_stack = [Mask('', '#')]
+            state_stack = [0]
+
+            # Parse tree and its node stack, which goes along with symbol stack except the bottom '#'.
+            tree = ParseTree(self.grammar, list(input_series)) if build_tree else None
+            node_stack = []
+            input_pos = 0
+
+            # Quaternary formulas generated so far, only written to quads when the input series is accepted.
+            generated = []
+
+            input_series.append(Mask('', '#'))
+
+            if trace is not None:
+                trace.begin(input_series)
+            try:
+                while True:
+                    # Get the top of state stack and its corresponding project set.
+                    top_state_num = state_stack[-1]
+
+                    # Pop in the first symbol of input series.
+                    input_symbol = input_series[0]
+
+                    action = self.get_action(top_state_num, input_symbol.outer)
+                    if action == 'Acc':
+                        action = 'R0'
+                    if len(action) == 0:
+                        if trace is None:
+                            self.print_stack(symbol_stack, state_stack, input_series, action, '', True)
+                        else:
+                            self.write_trace(trace, action, 0, None, None, input_pos, input_symbol)
+                        raise ValueError("Current state {} and input symbol {} don't match any action in analysis map."
+                                         .format(top_state_num, input_symbol.outer))
+                    if action[0] == 'S':
+                        stats.incr_parse('shifts')
+                        if trace is None:
+                            self.print_stack(symbol_stack, state_stack, input_series, action)
+                        else:
+                            self.write_trace(trace, action, 0, int(action[1:]), str(input_symbol),
+                                             input_pos, input_symbol)
 
-                non_t = Mask(non_t_inner, formula[0])
-                goto = int(self.get_action(state_stack[-1], non_t.outer)[1:])
-                state_stack.append(goto)
-                symbol_stack.append(non_t)
+                        symbol_stack.append(input_symbol)
+                        del input_series[0]
+                        state_stack.append(int(action[1:]))
+                        if build_tree:
+                            node_stack.append(tree.add_leaf(input_pos))
+                        input_pos += 1
+                    if action[0] == 'R':
+                        stats.incr_parse('reductions')
+                        formula = self.grammar.formula_list[int(action[1:])]
+                        formula_length = len(formula[1].split(' '))
+
+                        non_t_inner = ''
+                        quat = None
+                        quat_text = ''
+                        formula_type = get_formula_type(formula[1])
+                        if formula_type == FormulaType.ENTRY or formula_type == FormulaType.SINGLE:
+                            non_t_inner = symbol_stack[-1].inner
+                        elif formula_type == FormulaType.BRACKET:
+                            non_t_inner = symbol_stack[-2].inner
+                        elif formula_type == FormulaType.BIN:
+                            self.temp_num += 1
+                            stats.incr_parse('temps')
+                            temp = Mask('T{}'.format(self.temp_num), 'i')
+                            quat = get_quat(symbol_stack[-2], symbol_stack[-3], symbol_stack[-1], temp)
+                            non_t_inner = temp.inner
+                        elif formula_type == FormulaType.EQUAL:
+                            quat = get_quat(symbol_stack[-2], symbol_stack[-1], Mask('', ''), symbol_stack[-3])
+                        if quat is not None:
+                            stats.incr_parse('quads')
+                            generated.append(quat)
+                            quat_text = format_quat(quat)
+
+                        if trace is None:
+                            self.print_stack(symbol_stack, state_stack, input_series, action, quat_text)
+
+                        del state_stack[-formula_length:]
+                        del symbol_stack[-formula_length:]
+                        if build_tree:
+                            node_stack.append(tree.add_node(int(action[1:]), node_stack[-formula_length:]))
+                            del node_stack[-formula_length - 1:-1]
+
+                        if int(action[1:]) == 0 and input_symbol.outer == '#':
+                            if trace is None:
+                                self.print_stack(symbol_stack, state_stack, input_series, 'Acc', '', True)
+                            else:
+                                self.write_trace(trace, action, formula_length, None, None,
+                                                 input_pos, input_symbol, quat_text)
+                                self.write_trace(trace, 'Acc', 0, None, None, input_pos, input_symbol)
+                            if build_tree:
+                                tree.root = node_stack[-1]
+                            if quads is not None:
+                                for quat in generated:
+                                    quads.append(*quat)
+                            return tree
+
+                        non_t = Mask(non_t_inner, formula[0])
+                        goto = self.get_action(state_stack[-1], non_t.outer)
+                        if trace is not None:
+                            self.write_trace(trace, action, formula_length,
+                                             int(goto[1:]) if goto.startswith('S') else None, str(non_t),
+                                             input_pos, input_symbol, quat_text)
+                        goto = int(goto[1:])
+                        state_stack.append(goto)
+                        symbol_stack.append(non_t)
+            finally:
+                if trace is not None:
+                    trace.end()
+
+    def write_trace(self, trace, action, pop, push_state, push_symbol, input_pos, input_symbol, quat=''):
+        """
+        Write one step to trace sink, see TraceRow for meanings of parameters.
+        """
+        self.step += 1
+        trace.write(TraceRow(self.step, action, pop, push_state, push_symbol, input_pos, str(input_symbol), quat))
 
     def print_stack(self, symbol_stack, state_stack, input_series, action, quat='', print_out=False):
         """
@@ -174,4 +389,35 @@ class SLRAn(SLRMap):
                        len(max(action_str, key=len)) + 2)
             for i in range(self.step + 1):
                 print(format_string.format(step_str[i], state_stack_str[i], symbol_stack_str[i],
-                                           input_series_str[i], action_str[i], quat_str[i]))
\ No newline at end of file
+                                           input_series_str[i], action_str[i], quat_str[i]))
+
+
+def get_unit_elimination_report(grammar, series_list=()):
+    """
+    Compare analyzers constructed with and without unit formula elimination.
+
+    :param grammar: Grammar object.
+    :param series_list: list, containing input series to analysis, each one a list of Mask objects.
+    :return: dict, containing formula count, state count and total reductions of both analyzers,
+        and whether both analyzers give the same results and quaternary formulas for all input series.
+    """
+    report = dict()
+    quats = []
+    for name, analyzer in [('before', SLRAn(grammar)), ('after', SLRAn(grammar, eliminate_units=True))]:
+        report['formulas_' + name] = len(analyzer.grammar.formula_list)
+        report['states_' + name] = len(analyzer.map)
+        report['reductions_' + name] = 0
+        results = []
+        for series in series_list:
+            rows = []
+            try:
+                analyzer.analysis([Mask(s.inner, s.outer) for s in series], trace=CallbackTraceSink(rows.append))
+                results.append([row.quat for row in rows if len(row.quat) > 0])
+            except (ValueError, KeyError, IndexError):
+                results.append(None)
+            report['reductions_' + name] += analyzer.grammar.stats.last_parse['reductions']
+        quats.append(results)
+    report['states_saved'] = report['states_before'] - report['states_after']
+    report['reductions_saved'] = report['reductions_before'] - report['reductions_after']
+    report['same_results'] = quats[0] == quats[1]
+    return report
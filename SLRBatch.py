@@ -0,0 +1,96 @@
+import numpy as np
+
+
+class SLRBatch:
+    """
+    Batched SLR recognizer, advancing many input series in lockstep with NumPy table lookups.
+
+    Only accepts or rejects input series, no quaternary or trace is generated.
+    Results are the same as SLRAn.analysis: a series is rejected at the position of the input symbol
+    which doesn't match any action, whose reduction has no goto in the map, or whose reduction pops the whole stack.
+    """
+    def __init__(self, slr_map):
+        """
+        :param slr_map: SLRMap object, the analysis map to use.
+        """
+        grammar = slr_map.grammar
+        self.grammar = grammar
+        self.symbol_index, self.end_index, self.unknown_index, action = slr_map.encode_map()
+        self.action = np.array(action, dtype=np.int32)
+
+        self.formula_length = np.array([len(formula.split(' ')) for _, formula in grammar.formula_list],
+                                       dtype=np.int32)
+        self.formula_non_t = np.array([self.symbol_index[non_t] for non_t, _ in grammar.formula_list],
+                                      dtype=np.int32)
+
+    def encode_series(self, series_list):
+        """
+        Pad input series into a 2-D symbol index array, every row ends with '#'.
+
+        :param series_list: list, containing input series, each one a list of terminal symbols or Mask objects.
+        :return: numpy array, in 'series count x (max length + 1)' shape.
+        """
+        width = max([len(series) for series in series_list] + [0]) + 1
+        symbols = np.full((len(series_list), width), self.end_index, dtype=np.int32)
+        for i, series in enumerate(series_list):
+            symbols[i, :len(series)] = [self.symbol_index.get(s if isinstance(s, str) else s.outer,
+                                                              self.unknown_index) for s in series]
+        return symbols
+
+    def recognize(self, series_list):
+        """
+        Recognize all input series in lockstep.
+
+        :param series_list: list, containing input series, each one a list of terminal symbols or Mask objects.
+        :return: tuple of two numpy arrays, the first one contains bool flags of acceptance,
+            the second one contains failing positions in input series, -1 for accepted series.
+        """
+        count = len(series_list)
+        symbols = self.encode_series(series_list)
+
+        # State stacks of all series, one row per series, with stack depth in 'depth'.
+        stack = np.zeros((count, symbols.shape[1] + 2), dtype=np.int32)
+        depth = np.ones(count, dtype=np.int64)
+        pos = np.zeros(count, dtype=np.int64)
+        accepted = np.zeros(count, dtype=bool)
+        fail_pos = np.full(count, -1, dtype=np.int64)
+
+        active = np.arange(count)
+        while active.size > 0:
+            if depth[active].max() >= stack.shape[1]:
+                stack = np.concatenate([stack, np.zeros_like(stack)], axis=1)
+            input_symbol = symbols[active, pos[active]]
+            action = self.action[stack[active, depth[active] - 1], input_symbol]
+
+            # Shift.
+            shift = active[action > 0]
+            stack[shift, depth[shift]] = action[action > 0] - 1
+            depth[shift] += 1
+            pos[shift] += 1
+
+            # Reduce, 'Acc' is reduced as formula 0 in the same way as analysis.
+            reduce_mask = action < 0
+            reduce = active[reduce_mask]
+            formula = np.where(action[reduce_mask] == -1, 0, -action[reduce_mask] - 2)
+            # Reductions popping the whole stack are rejected, like 'Acc' in state 0 for an empty input series.
+            depth[reduce] -= self.formula_length[formula]
+            has_state = depth[reduce] > 0
+            done = has_state & (formula == 0) & (input_symbol[reduce_mask] == self.end_index)
+            accepted[reduce[done]] = True
+            reduce, formula, has_state = reduce[~done], formula[~done], has_state[~done]
+
+            # Goto, series without a valid goto are rejected.
+            goto = np.zeros(reduce.size, dtype=np.int32)
+            goto[has_state] = self.action[stack[reduce[has_state], depth[reduce[has_state]] - 1],
+                                          self.formula_non_t[formula[has_state]]]
+            valid = goto > 0
+            stack[reduce[valid], depth[reduce[valid]]] = goto[valid] - 1
+            depth[reduce[valid]] += 1
+
+            # Error.
+            rejected = np.concatenate([active[action == 0], reduce[~valid]])
+            fail_pos[rejected] = pos[rejected]
+            depth[rejected] = 0
+
+            active = active[~accepted[active] & (depth[active] > 0)]
+        return accepted, fail_pos
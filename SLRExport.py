@@ -0,0 +1,276 @@
+import csv
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+from QuadBuffer import to_little_endian
+from SLRMap import encode_action, decode_action
+
+# Magic bytes and version at the beginning of binary sparse table files.
+MAGIC = b'SLRT'
+VERSION = 2
+
+# One changed cell found by diff_tables. States are numbers in each table, None if the state only exists in one
+# table; actions are strings like 'S10' or 'R5', '' if the cell is empty. Targets are the kernels of shift target
+# states as tuples of strings, None if the action is not a shift, so that shifts to renumbered states can be told.
+CellChange = namedtuple('CellChange', ['old_state', 'new_state', 'symbol', 'old_action', 'new_action',
+                                       'old_target', 'new_target'])
+
+
+def get_kernel_strings(slr_map):
+    """
+    :param slr_map: SLRMap object.
+    :return: list, containing every state's kernel projects as a tuple of strings like 'E -> E + . T',
+        or None if kernels are dropped in lean mode.
+    """
+    slr_map.construct_all()
+    if slr_map.lean:
+        return None if slr_map.kernels is None else list(slr_map.kernels)
+    return [tuple(p.get_key() for p in ps.get_kernel()) for ps in slr_map.ps_list]
+
+
+def iter_sparse_rows(slr_map):
+    """
+    Iterate over non-empty cells of an SLR map row by row, without building any other table.
+
+    :param slr_map: SLRMap object.
+    :return: generator, yielding (state, symbol indexes, encoded actions) for every state,
+        the last two are array objects, actions are encoded by encode_action.
+    """
+    slr_map.construct_all()
+    for state, row in enumerate(slr_map.map):
+        symbols = array('i')
+        codes = array('i')
+        for j, action in enumerate(row):
+            if len(action) > 0:
+                symbols.append(j)
+                codes.append(encode_action(action))
+        yield state, symbols, codes
+
+
+def write_sparse_csv(slr_map, file):
+    """
+    Write non-empty cells of an SLR map as 'state,symbol,action' csv rows.
+
+    :param slr_map: SLRMap object.
+    :param file: file object opened in text mode.
+    """
+    symbols = slr_map.grammar.symbols
+    writer = csv.writer(file, delimiter=',')
+    writer.writerow(['state', 'symbol', 'action'])
+    for state, row_symbols, codes in iter_sparse_rows(slr_map):
+        writer.writerows([(state, symbols[j], decode_action(code)) for j, code in zip(row_symbols, codes)])
+
+
+def write_strings(file, strings):
+    """
+    Write a string table: lengths of all encoded strings, then their bytes.
+
+    :param file: file object opened in binary mode.
+    :param strings: list, containing str objects.
+    """
+    encoded = [string.encode() for string in strings]
+    to_little_endian(array('i', [len(string) for string in encoded])).tofile(file)
+    file.write(b''.join(encoded))
+
+
+def read_strings(file, count):
+    """
+    :param file: file object opened in binary mode.
+    :param count: int, string count.
+    :return: list, containing str objects written by write_strings.
+    """
+    lengths = array('i')
+    lengths.fromfile(file, count)
+    if sys.byteorder == 'big':
+        lengths.byteswap()
+    data = file.read(sum(lengths))
+    result = []
+    pos = 0
+    for length in lengths:
+        result.append(data[pos:pos + length].decode())
+        pos += length
+    return result
+
+
+def read_column(file, count):
+    """
+    :param file: file object opened in binary mode.
+    :param count: int, item count.
+    :return: array object, little endian integers converted to native byte order.
+    """
+    column = array('i')
+    column.fromfile(file, count)
+    if sys.byteorder == 'big':
+        column.byteswap()
+    return column
+
+
+def write_sparse_binary(slr_map, file):
+    """
+    Write non-empty cells of an SLR map in compact binary form, one row at a time.
+    The file contains a header, symbols, formulas and kernels as string tables, then every state's
+    cell count, symbol indexes and encoded actions, all in little endian.
+
+    :param slr_map: SLRMap object.
+    :param file: file object opened in binary mode.
+    """
+    grammar = slr_map.grammar
+    kernels = get_kernel_strings(slr_map)
+    file.write(MAGIC)
+    file.write(struct.pack('<IIIII', VERSION, len(grammar.symbols), len(grammar.formula_list),
+                           len(slr_map.map), kernels is not None))
+    write_strings(file, grammar.symbols)
+    write_strings(file, [string for formula in grammar.formula_list for string in formula])
+    if kernels is not None:
+        file.write(struct.pack('<{}I'.format(len(kernels)), *[len(kernel) for kernel in kernels]))
+        write_strings(file, [project for kernel in kernels for project in kernel])
+    for _, symbols, codes in iter_sparse_rows(slr_map):
+        file.write(struct.pack('<I', len(symbols)))
+        to_little_endian(symbols).tofile(file)
+        to_little_endian(codes).tofile(file)
+
+
+class SparseTable:
+    """
+    SLR map with only non-empty cells, together with what is needed to compare it with other maps:
+    symbols, formulas, and kernels of states.
+    """
+    def __init__(self, symbols, formula_list, kernels, rows):
+        """
+        :param symbols: list, containing symbols of map columns.
+        :param formula_list: list, containing (non_t, formula) tuples in formula index order.
+        :param kernels: list, containing every state's kernel projects as a tuple of strings, or None if unknown.
+        :param rows: list, containing (symbol indexes, encoded actions) array pairs of every state.
+        """
+        self.symbols = symbols
+        self.formula_list = formula_list
+        self.kernels = kernels
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def from_map(cls, slr_map):
+        """
+        :param slr_map: SLRMap object.
+        :return: SparseTable object.
+        """
+        rows = [(symbols, codes) for _, symbols, codes in iter_sparse_rows(slr_map)]
+        return cls(list(slr_map.grammar.symbols), list(slr_map.grammar.formula_list),
+                   get_kernel_strings(slr_map), rows)
+
+    @classmethod
+    def read_binary(cls, file):
+        """
+        Read a table written by write_sparse_binary.
+
+        :param file: file object opened in binary mode.
+        :return: SparseTable object.
+        :raise: ValueError when the file is not a binary sparse table file.
+        """
+        if file.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a binary sparse table file.")
+        version, symbol_count, formula_count, state_count, has_kernels = struct.unpack('<IIIII', file.read(20))
+        if version != VERSION:
+            raise ValueError("Unsupported binary sparse table file version {}.".format(version))
+        symbols = read_strings(file, symbol_count)
+        strings = read_strings(file, formula_count * 2)
+        formula_list = list(zip(strings[0::2], strings[1::2]))
+        kernels = None
+        if has_kernels:
+            sizes = struct.unpack('<{}I'.format(state_count), file.read(4 * state_count))
+            projects = read_strings(file, sum(sizes))
+            kernels = []
+            pos = 0
+            for size in sizes:
+                kernels.append(tuple(projects[pos:pos + size]))
+                pos += size
+        rows = []
+        for _ in range(state_count):
+            count, = struct.unpack('<I', file.read(4))
+            rows.append((read_column(file, count), read_column(file, count)))
+        return cls(symbols, formula_list, kernels, rows)
+
+    def get_row(self, state):
+        """
+        :param state: int, state number.
+        :return: dict, in 'symbol -> action string' format, only containing non-empty cells.
+        """
+        symbols, codes = self.rows[state]
+        return {self.symbols[j]: decode_action(code) for j, code in zip(symbols, codes)}
+
+    def get_target(self, action):
+        """
+        :param action: str, action like 'S10' or 'R5'.
+        :return: tuple, kernel strings of the shift target state, or None if the action is not a shift.
+        """
+        if not action.startswith('S'):
+            return None
+        return self.kernels[int(action[1:])]
+
+    def get_canonical_row(self, state):
+        """
+        Describe a row without state numbers and formula indexes, so that rows of different tables can be compared.
+
+        :param state: int, state number.
+        :return: dict, in 'symbol -> action' format, where a shift is ('S', target kernel),
+            a reduction is ('R', (non_t, formula)), and accept is ('Acc',).
+        """
+        result = dict()
+        symbols, codes = self.rows[state]
+        for j, code in zip(symbols, codes):
+            if code > 0:
+                result[self.symbols[j]] = ('S', frozenset(self.kernels[code - 1]))
+            elif code == -1:
+                result[self.symbols[j]] = ('Acc',)
+            else:
+                result[self.symbols[j]] = ('R', self.formula_list[-code - 2])
+        return result
+
+
+def diff_tables(old, new):
+    """
+    Compare two SLR maps of the same grammar family, mapping states by kernel instead of state number.
+    Shifts are equal if their target states have the same kernel, reductions are equal if their formulas
+    are the same, so renumbered states and formulas are not reported.
+
+    :param old: SLRMap or SparseTable object.
+    :param new: SLRMap or SparseTable object.
+    :return: dict, containing old state numbers only in old table as 'states_removed', new state numbers
+        only in new table as 'states_added', and a list of CellChange objects as 'changes'.
+        Cells of added and removed states are not listed in 'changes'.
+    :raise: ValueError when kernels of either table are unknown.
+    """
+    if not isinstance(old, SparseTable):
+        old = SparseTable.from_map(old)
+    if not isinstance(new, SparseTable):
+        new = SparseTable.from_map(new)
+    if old.kernels is None or new.kernels is None:
+        raise ValueError("Kernels are needed to compare tables, they are dropped in lean mode.")
+
+    old_states = {frozenset(kernel): i for i, kernel in enumerate(old.kernels)}
+    new_states = {frozenset(kernel): i for i, kernel in enumerate(new.kernels)}
+    changes = []
+    for kernel, new_state in new_states.items():
+        old_state = old_states.get(kernel)
+        if old_state is None:
+            continue
+        old_row = old.get_canonical_row(old_state)
+        new_row = new.get_canonical_row(new_state)
+        if old_row == new_row:
+            continue
+        old_actions = old.get_row(old_state)
+        new_actions = new.get_row(new_state)
+        for symbol in sorted(set(old_row) | set(new_row)):
+            if old_row.get(symbol) != new_row.get(symbol):
+                old_action, new_action = old_actions.get(symbol, ''), new_actions.get(symbol, '')
+                changes.append(CellChange(old_state, new_state, symbol, old_action, new_action,
+                                          old.get_target(old_action), new.get_target(new_action)))
+    return {
+        'states_removed': sorted(i for kernel, i in old_states.items() if kernel not in new_states),
+        'states_added': sorted(i for kernel, i in new_states.items() if kernel not in old_states),
+        'changes': changes,
+    }
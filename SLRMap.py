@@ -1,5 +1,71 @@
+from grammar import is_unit_formula, normalize_formula
 from project import get_init_ps, ProjectSet
+from stats import Stats, get_deep_size
 import csv
+import sys
+
+
+def encode_action(action):
+    """
+    Encode an action string of SLR map into an integer.
+    '' is encoded to 0, 'Acc' to -1, 'S{n}' to n + 1 and 'R{n}' to -(n + 2).
+
+    :param action: str, action in SLR map like 'S10' or 'R5'.
+    :return: int, the encoded action.
+    """
+    if len(action) == 0:
+        return 0
+    elif action == 'Acc':
+        return -1
+    elif action[0] == 'S':
+        return int(action[1:]) + 1
+    else:
+        return -int(action[1:]) - 2
+
+
+def decode_action(code):
+    """
+    Decode an integer encoded by encode_action back to action string.
+
+    :param code: int, the encoded action.
+    :return: str, action in SLR map like 'S10' or 'R5'.
+    """
+    if code == 0:
+        return ''
+    elif code == -1:
+        return 'Acc'
+    elif code > 0:
+        return 'S{}'.format(code - 1)
+    else:
+        return 'R{}'.format(-code - 2)
+
+
+def get_unit_eliminated_grammar(grammar):
+    """
+    Eliminate unit formulas of a grammar one by one, keeping only eliminations after which the grammar is still SLR(1).
+    Eliminating all unit formulas of a layered grammar like E->T, T->F often leads to reduce-reduce conflicts,
+    for example both E->T*F and T->T*F exist after E->T is eliminated.
+    Unit formulas are tried from the last to the first, as lower layers are usually written later.
+
+    :param grammar: Grammar object.
+    :return: Grammar object, the new grammar sharing given grammar's stats.
+    """
+    eliminated = []
+    result = grammar
+    for non_t, formula in reversed(grammar.formula_list):
+        if not is_unit_formula(formula):
+            continue
+        # Try in a separate stats, so that failed attempts are not counted.
+        candidate = grammar.eliminate_unit_productions(eliminated + [(non_t, formula)], Stats())
+        try:
+            SLRMap(candidate)
+        except ValueError:
+            continue
+        eliminated.append((non_t, formula))
+        result = candidate
+    result.stats = grammar.stats
+    grammar.stats.incr('unit_formulas_removed', len(eliminated))
+    return result
 
 
 class SLRMap:
@@ -7,11 +73,36 @@ class SLRMap:
     SLR(1) grammar analysis map constructor.
     """
 
-    def __init__(self, grammar):
+    def __init__(self, grammar, lean=False, keep_kernels=True, lazy=False, eliminate_units=False):
         """
         :param grammar: Grammar object.
+        :param lean: bool, drop project sets and read dict after map construction to save memory.
+            Analysis only needs the map and grammar's formula list.
+        :param keep_kernels: bool, in lean mode, keep every project set's kernel as strings
+            so that print_ps_list still works.
+        :param lazy: bool, construct project sets and map rows only when analysis first reaches them.
+            Use construct_all to force full construction, for example to check conflicts.
+        :param eliminate_units: bool, construct the map from an equivalent grammar with as many unit formulas
+            eliminated as possible, see get_unit_eliminated_grammar.
+        :raise: ValueError when lazy is set together with lean or eliminate_units, as both need full construction.
         """
+        if lean and lazy:
+            raise ValueError("Lean mode needs full construction, can't be used together with lazy mode.")
+        if eliminate_units and lazy:
+            # Every tried elimination is checked by a full map construction.
+            raise ValueError("Unit formula elimination needs full construction, can't be used together with lazy mode.")
+
+        if eliminate_units:
+            grammar = get_unit_eliminated_grammar(grammar)
         self.grammar = grammar
+        self.lean = lean
+        self.lazy = lazy
+
+        # Kernels of project sets as string tuples, only used in lean mode.
+        self.kernels = None
+
+        # Memory in bytes saved by lean mode.
+        self.lean_bytes_saved = 0
 
         # The total state count in this SLR map. Will increase in the process of SLR map construction.
         self.state_count = 0
@@ -19,68 +110,369 @@ class SLRMap:
         # List of valid project sets.
         self.ps_list = []
 
+        # A dict used to find existing project sets, in 'frozenset of projects -> ProjectSet' format.
+        self.ps_dict = dict()
+
+        # Indexes of project sets whose read operations are already done.
+        self.expanded = set()
+
         # A dict containing symbol reading and project set transfer information.
         # The dict's format is (Original_ps, read_symbol) -> (Transfer_ps).
         self.read_dict = dict()
 
-        self.construct_ps_list()
-        self.map = self.construct_map()
+        if lazy:
+            # Rows are None until first reached.
+            self.add_ps(get_init_ps(self.grammar))
+            self.map = [None]
+            return
+        with grammar.stats.phase('construct_ps_list'):
+            self.construct_ps_list()
+        with grammar.stats.phase('construct_map'):
+            self.map = self.construct_map()
+        if lean:
+            self.make_lean(keep_kernels)
+
+    def make_lean(self, keep_kernels=True):
+        """
+        Drop project sets and read dict, keeping only the map and optionally project sets' kernels.
+        Map cells and kernel strings are interned so that identical ones share one string, also across grammars.
+
+        :param keep_kernels: bool, keep every project set's kernel as strings or not.
+        :return: int, memory in bytes saved.
+        """
+        before = get_deep_size([self.ps_list, self.ps_dict, self.expanded, self.read_dict, self.map],
+                               exclude=[self.grammar])
+        if keep_kernels:
+            self.kernels = [tuple(sys.intern(p.get_key()) for p in ps.get_kernel()) for ps in self.ps_list]
+        self.map = [[sys.intern(action) for action in row] for row in self.map]
+        self.ps_list = []
+        self.ps_dict = dict()
+        self.expanded = set()
+        self.read_dict = dict()
+        self.lean = True
+        after = get_deep_size([self.kernels, self.map])
+        self.lean_bytes_saved = before - after
+        self.grammar.stats.incr('lean_bytes_saved', self.lean_bytes_saved)
+        return self.lean_bytes_saved
+
+    def add_ps(self, ps):
+        """
+        Add a project set to ps list if there is no same project set in it.
+
+        :param ps: ProjectSet object, the project set to add.
+        :return: ProjectSet object, the added one, or the existing one which is same as given project set.
+        """
+        key = frozenset(ps.project_list)
+        if key in self.ps_dict:
+            self.grammar.stats.incr('duplicate_kernel_hits')
+            return self.ps_dict[key]
+        ps.index = self.state_count
+        self.ps_list.append(ps)
+        self.ps_dict[key] = ps
+        self.state_count += 1
+        self.grammar.stats.incr('states_created')
+        return ps
+
+    def expand_ps(self, ps):
+        """
+        Do all read operations of a project set, adding new project sets and transfer information.
+
+        :param ps: ProjectSet object, the project set to expand.
+        """
+        if ps.index in self.expanded:
+            return
+        self.expanded.add(ps.index)
+        state = ps.get_state()
+        if state == ProjectSet.ProjectSetState.MOVE or state == ProjectSet.ProjectSetState.BOTH:
+            for read_symbol in ps.get_all_readable():
+                new_ps = self.add_ps(ps.read(read_symbol, self.state_count))
+                # Assign transfer information to read dict.
+                self.read_dict[(ps, read_symbol)] = new_ps
 
     def construct_ps_list(self):
         """
         Construct all project set list.
         """
         # Init the first project set C0.
-        init_ps = get_init_ps(self.grammar)
-        self.ps_list.append(init_ps)
-        self.state_count += 1
+        if len(self.ps_list) == 0:
+            self.add_ps(get_init_ps(self.grammar))
 
-        # Use stack to process until there is no project set in move state.
-        ps_stack = [init_ps]
-        while len(ps_stack) > 0:
-            stack_top = ps_stack[0]
-            del ps_stack[0]
-            state = stack_top.get_state()
-            if state == ProjectSet.ProjectSetState.STATUTE:
-                continue
-            elif state == ProjectSet.ProjectSetState.MOVE or state == ProjectSet.ProjectSetState.BOTH:
-                for read_symbol in stack_top.get_all_readable():
-                    new_ps = stack_top.read(read_symbol, self.state_count)
-                    if new_ps not in self.ps_list:
-                        # new project set is not in ps list.
-                        self.ps_list.append(new_ps)
-                        self.state_count += 1
-                        ps_stack.append(new_ps)
-                    else:
-                        # new project is already in ps list.
-                        new_ps = self.ps_list[self.ps_list.index(new_ps)]
-                    # Assign transfer information to read dict.
-                    self.read_dict[(stack_top, read_symbol)] = new_ps
+        # Expand project sets in the order they are added, until there is no new project set.
+        i = 0
+        while i < len(self.ps_list):
+            self.expand_ps(self.ps_list[i])
+            i += 1
+
+    def construct_row(self, i):
+        """
+        Construct one row of SLR(1) analysis map. The project set must be expanded first.
+
+        :param i: int, index of the project set.
+        :return: list, the map row.
+        """
+        map_matrix_row = [''] * len(self.grammar.symbols)
+        ps = self.ps_list[i]
+        state = ps.get_state()
+        if state == ProjectSet.ProjectSetState.MOVE or state == ProjectSet.ProjectSetState.BOTH:
+            for symbol in ps.get_all_readable():
+                transfer_ps = self.read_dict[(ps, symbol)]
+                map_matrix_row[self.grammar.get_symbol_index(symbol)] = 'S{}'.format(transfer_ps.index)
+        if state == ProjectSet.ProjectSetState.BOTH or state == ProjectSet.ProjectSetState.STATUTE:
+            statute_dict = ps.process_double()
+            for project, input_symbol in statute_dict.items():
+                formula = ' '.join(project.symbols)
+                formula_index = self.grammar.get_formula_index(project.non_t, formula)
+                for follow_symbol in input_symbol:
+                    symbol_index = self.grammar.get_symbol_index(follow_symbol)
+                    if len(map_matrix_row[symbol_index]) > 0:
+                        # Conflict with move in, resolve by precedence.
+                        resolution = self.grammar.resolve_conflict(formula, follow_symbol)
+                        self.grammar.stats.incr('conflicts_resolved')
+                        if resolution == 'S':
+                            continue
+                        elif resolution == '':
+                            map_matrix_row[symbol_index] = ''
+                            continue
+                    map_matrix_row[symbol_index] = 'R{}'.format(formula_index)
+        if i == 0:
+            map_matrix_row[self.grammar.get_symbol_index('#')] = 'Acc'
+        return map_matrix_row
 
     def construct_map(self):
         """
         Construct SLR(1) analysis map.
         """
-        map_matrix = []
-        for i in range(len(self.ps_list)):
-            map_matrix_row = [''] * len(self.grammar.symbols)
-            ps = self.ps_list[i]
-            state = ps.get_state()
-            if state == ProjectSet.ProjectSetState.MOVE or state == ProjectSet.ProjectSetState.BOTH:
-                for symbol in ps.get_all_readable():
-                    transfer_ps = self.read_dict[(ps, symbol)]
-                    map_matrix_row[self.grammar.get_symbol_index(symbol)] = 'S{}'.format(transfer_ps.index)
-            if state == ProjectSet.ProjectSetState.BOTH or state == ProjectSet.ProjectSetState.STATUTE:
-                statute_dict = ps.process_double()
-                for project, input_symbol in statute_dict.items():
-                    formula_index = self.grammar.get_formula_index(project.non_t, ' '.join(project.symbols))
-                    for follow_symbol in input_symbol:
-                        map_matrix_row[self.grammar.get_symbol_index(follow_symbol)] = 'R{}'.format(formula_index)
-                        # if follow_symbol == '#' and formula_index == 0:
-                        #     map_matrix_row[self.grammar.get_symbol_index(follow_symbol)] = 'Acc'
-            map_matrix.append(map_matrix_row)
-        map_matrix[0][self.grammar.get_symbol_index('#')] = 'Acc'
-        return map_matrix
+        return [self.construct_row(i) for i in range(len(self.ps_list))]
+
+    def materialize(self, i):
+        """
+        In lazy mode, construct one project set's read operations and map row.
+
+        :param i: int, index of the project set.
+        :return: list, the map row.
+        """
+        with self.grammar.stats.phase('materialize'):
+            self.expand_ps(self.ps_list[i])
+            self.map.extend([None] * (len(self.ps_list) - len(self.map)))
+            self.map[i] = self.construct_row(i)
+            self.grammar.stats.incr('rows_materialized')
+        return self.map[i]
+
+    def construct_all(self):
+        """
+        In lazy mode, force construction of all project sets and map rows.
+        Conflicts in the grammar will raise ValueError here, as in full construction.
+        Does nothing if not in lazy mode.
+        """
+        if not self.lazy:
+            return
+        self.construct_ps_list()
+        self.map.extend([None] * (len(self.ps_list) - len(self.map)))
+        for i in range(len(self.map)):
+            if self.map[i] is None:
+                self.map[i] = self.construct_row(i)
+
+    def encode_map(self):
+        """
+        Integer form of the whole map, used by SLRBatch and SLRShortcuts.
+
+        :return: tuple, (symbol index dict in 'symbol -> column' format, column of '#', column of unknown symbols,
+            list of rows encoded by encode_action). Symbols not in grammar are mapped to an extra last column
+            without any action.
+        """
+        self.construct_all()
+        symbol_index = {symbol: i for i, symbol in enumerate(self.grammar.symbols)}
+        action = [[encode_action(action) for action in row] + [0] for row in self.map]
+        return symbol_index, symbol_index['#'], len(self.grammar.symbols), action
+
+    def add_formula(self, non_t, formula):
+        """
+        Add one formula to grammar and patch the map, see apply_grammar_edit.
+
+        :param non_t: str, non-terminal symbol of the formula.
+        :param formula: str, formula content, symbols separated by ' '.
+        :return: dict, containing counts of reused, re-derived and removed states, patched and rebuilt rows.
+        :raise: ValueError in lean mode, when the formula is already in grammar, or when the new grammar
+            is not SLR(1). The grammar and map are left unchanged in that case.
+        """
+        return self.edit_grammar(non_t, formula, True)
+
+    def remove_formula(self, non_t, formula):
+        """
+        Remove one formula from grammar and patch the map, see apply_grammar_edit.
+
+        :param non_t: str, non-terminal symbol of the formula.
+        :param formula: str, formula content, symbols separated by ' '.
+        :return: dict, containing counts of reused, re-derived and removed states, patched and rebuilt rows.
+        :raise: ValueError in lean mode, when the formula is not in grammar, or when the new grammar
+            is not SLR(1). The grammar and map are left unchanged in that case.
+        """
+        return self.edit_grammar(non_t, formula, False)
+
+    def edit_grammar(self, non_t, formula, add):
+        """
+        Add or remove one formula, restoring grammar, project sets and map if the new grammar is not SLR(1).
+
+        :param non_t: str, non-terminal symbol of the formula.
+        :param formula: str, formula content, symbols separated by ' '.
+        :param add: bool, add the formula if true, otherwise remove it.
+        :return: dict, same as apply_grammar_edit.
+        """
+        if self.lean:
+            raise ValueError("Project sets are dropped in lean mode, grammar can't be edited.")
+        non_t, formula = normalize_formula(non_t, formula)
+        self.construct_all()
+        grammar = self.grammar
+        backup = (grammar.grammar, grammar.non_ts, grammar.formula_list, grammar.symbols,
+                  {key: set(first) for key, first in grammar.first_dict.items()},
+                  {key: set(follow) for key, follow in grammar.follow_dict.items()},
+                  self.ps_list, self.ps_dict, self.expanded, self.read_dict, self.map, self.state_count,
+                  [ps.index for ps in self.ps_list])
+        old_formula_list, old_symbols = grammar.formula_list, grammar.symbols
+        try:
+            try:
+                if add:
+                    follow_changed = grammar.add_formula(non_t, formula)
+                else:
+                    follow_changed = grammar.remove_formula(non_t, formula)
+            except RecursionError:
+                # get_first can't handle indirect left recursion, full construction fails in the same way.
+                raise ValueError("Can't construct FIRST(a) arrays, the grammar may be indirectly left-recursive.")
+            return self.apply_grammar_edit(non_t, follow_changed, old_formula_list, old_symbols)
+        except ValueError:
+            (grammar.grammar, grammar.non_ts, grammar.formula_list, grammar.symbols, grammar.first_dict,
+             grammar.follow_dict, self.ps_list, self.ps_dict, self.expanded, self.read_dict, self.map,
+             self.state_count, indexes) = backup
+            for ps, index in zip(self.ps_list, indexes):
+                ps.index = index
+            raise
+
+    def apply_grammar_edit(self, non_t, follow_changed, old_formula_list, old_symbols):
+        """
+        Update project sets and map after formulas of one non-terminal symbol are changed in grammar.
+
+        A project set's closure only changes if it expands the changed non-terminal symbol, so project sets
+        are rebuilt from the initial one by kernel: unaffected project sets and their read operations are reused,
+        only affected and new ones are re-derived. States are renumbered in the order they are reached,
+        unreachable ones are dropped. Rows of reused states are patched by remapping state numbers, formula
+        indexes and symbol columns, unless FOLLOW(A) of one of their statute projects is changed.
+
+        :param non_t: str, non-terminal symbol whose formulas are changed.
+        :param follow_changed: set, non-terminal symbols whose FOLLOW(A) array is changed.
+        :param old_formula_list: list, grammar's formula list before the change.
+        :param old_symbols: list, grammar's symbols before the change.
+        :return: dict, containing counts of reused, re-derived and removed states, patched and rebuilt rows.
+        :raise: ValueError when the new grammar is not SLR(1).
+        """
+        stats = self.grammar.stats
+        with stats.phase('apply_grammar_edit'):
+            old_ps_list, old_map, old_read_dict = self.ps_list, self.map, self.read_dict
+            old_indexes = {id(ps): ps.index for ps in old_ps_list}
+            old_by_kernel = {frozenset(ps.get_kernel()): ps for ps in old_ps_list}
+            affected = {id(ps) for ps in old_ps_list
+                        if any(p.non_t == non_t and p.pos == 0 for p in ps.project_list)}
+
+            self.ps_list = []
+            self.ps_dict = dict()
+            self.read_dict = dict()
+            self.state_count = 0
+            kernel_dict = dict()
+            reused = set()
+
+            def add_kernel(key, build):
+                # Find or add the project set of a kernel, 'build' creates it if it can't be reused.
+                if key in kernel_dict:
+                    return kernel_dict[key]
+                ps = old_by_kernel.get(key)
+                if ps is not None and id(ps) not in affected:
+                    reused.add(id(ps))
+                else:
+                    ps = build()
+                ps.index = self.state_count
+                self.ps_list.append(ps)
+                self.ps_dict[frozenset(ps.project_list)] = ps
+                kernel_dict[key] = ps
+                self.state_count += 1
+                return ps
+
+            init_ps = get_init_ps(self.grammar)
+            add_kernel(frozenset(init_ps.get_kernel()), lambda: init_ps)
+            i = 0
+            while i < len(self.ps_list):
+                ps = self.ps_list[i]
+                if ps.get_state() != ProjectSet.ProjectSetState.STATUTE:
+                    for read_symbol in ps.get_all_readable():
+                        if (ps, read_symbol) in self.read_dict:
+                            continue
+                        if id(ps) in reused:
+                            kernel = [p for p in old_read_dict[(ps, read_symbol)].project_list if p.pos > 0]
+                            new_ps = add_kernel(frozenset(kernel), lambda: ProjectSet(self.grammar, kernel, -1))
+                        else:
+                            new_ps = ps.read(read_symbol)
+                            new_ps = add_kernel(frozenset(p for p in new_ps.project_list if p.pos > 0),
+                                                lambda: new_ps)
+                        self.read_dict[(ps, read_symbol)] = new_ps
+                i += 1
+            self.expanded = set(range(self.state_count))
+
+            # Remap tables from old numbering to new numbering.
+            state_remap = {old_indexes[id(ps)]: ps.index for ps in self.ps_list if id(ps) in reused}
+            formula_index = {formula: j for j, formula in enumerate(self.grammar.formula_list)}
+            formula_remap = {j: formula_index[formula] for j, formula in enumerate(old_formula_list)
+                             if formula in formula_index}
+            symbol_remap = {j: self.grammar.symbols.index(symbol) for j, symbol in enumerate(old_symbols)
+                            if symbol in self.grammar.symbols}
+
+            self.map = []
+            patched = 0
+            for ps in self.ps_list:
+                row = None
+                if id(ps) in reused and not any(p.non_t in follow_changed and not p.can_move()
+                                                for p in ps.project_list):
+                    row = self.patch_row(old_map[old_indexes[id(ps)]], state_remap, formula_remap, symbol_remap)
+                if row is None:
+                    row = self.construct_row(ps.index)
+                else:
+                    patched += 1
+                self.map.append(row)
+
+            result = {
+                'states_reused': len(reused),
+                'states_rederived': self.state_count - len(reused),
+                'states_removed': len(set(old_by_kernel) - set(kernel_dict)),
+                'rows_patched': patched,
+                'rows_rebuilt': self.state_count - patched,
+            }
+            for name, value in result.items():
+                stats.incr(name, value)
+        return result
+
+    def patch_row(self, row, state_remap, formula_remap, symbol_remap):
+        """
+        Remap state numbers, formula indexes and symbol columns of a map row.
+
+        :param row: list, the old map row.
+        :param state_remap: dict, in 'old state number -> new state number' format.
+        :param formula_remap: dict, in 'old formula index -> new formula index' format.
+        :param symbol_remap: dict, in 'old symbol index -> new symbol index' format.
+        :return: list, the new map row, or None if some action can't be remapped.
+        """
+        result = [''] * len(self.grammar.symbols)
+        for j, action in enumerate(row):
+            if len(action) == 0:
+                continue
+            if j not in symbol_remap:
+                return None
+            if action[0] == 'S':
+                if int(action[1:]) not in state_remap:
+                    return None
+                action = 'S{}'.format(state_remap[int(action[1:])])
+            elif action[0] == 'R':
+                if int(action[1:]) not in formula_remap:
+                    return None
+                action = 'R{}'.format(formula_remap[int(action[1:])])
+            result[symbol_remap[j]] = action
+        return result
 
     def get_action(self, current_state, input_symbol):
         """
@@ -90,9 +482,20 @@ class SLRMap:
         :param input_symbol: str, input symbol.
         :return: str, next action to take like 'S10' or 'R5'.
         """
-        return self.map[current_state][self.grammar.get_symbol_index(input_symbol)]
+        row = self.map[current_state]
+        if row is None:
+            row = self.materialize(current_state)
+        return row[self.grammar.get_symbol_index(input_symbol)]
 
     def print_ps_list(self):
+        self.construct_all()
+        if self.lean:
+            if self.kernels is None:
+                print('Project sets are dropped in lean mode.')
+            else:
+                for i in range(len(self.kernels)):
+                    print('C{}: {{{}}}'.format(i, ', '.join(self.kernels[i])))
+            return
         for ps in self.ps_list:
             print(ps)
 
@@ -100,8 +503,16 @@ class SLRMap:
         """
         Print out read dict information.
 
-        :param full: bool, print all project sets' content or not.
+        :param full: bool, print all project sets' content or not. Ignored in lean mode.
         """
+        self.construct_all()
+        if self.lean:
+            # Read dict is dropped, but all transfer information is still in the map.
+            for i in range(len(self.map)):
+                for symbol, action in zip(self.grammar.symbols, self.map[i]):
+                    if action.startswith('S'):
+                        print('{:4}{:2} -> C{}'.format('C' + str(i), symbol, action[1:]))
+            return
         for (original_ps, read_symbol), transfer_ps in self.read_dict.items():
             if full:
                 print('{} {} -> {}'.format(str(original_ps), read_symbol, str(transfer_ps)))
@@ -112,9 +523,10 @@ class SLRMap:
         """
         Print out SLR(1) analysis map.
         """
+        self.construct_all()
         format_string = '{:5}' * (len(self.grammar.symbols) + 1)
         print(format_string.format(*([''] + self.grammar.symbols)))
-        for i in range(len(self.ps_list)):
+        for i in range(len(self.map)):
             print(format_string.format(*(['S{}'.format(i)] + self.map[i])))
 
     def export_to_csv(self, file_name='map.csv'):
@@ -123,8 +535,9 @@ class SLRMap:
 
         :param file_name: the csv file directory to export.
         """
+        self.construct_all()
         with open(file_name, 'w', newline='') as file:
             writer = csv.writer(file, delimiter=',')
             writer.writerow([''] + self.grammar.symbols)
-            for i in range(len(self.ps_list)):
+            for i in range(len(self.map)):
                 writer.writerow(['S{}'.format(i)] + self.map[i])
@@ -0,0 +1,97 @@
+from grammar import get_formula_type
+
+
+class SLRShortcuts:
+    """
+    Integer analysis tables with precomputed per-state shortcuts, used by SLRAn.fast_analysis.
+
+    A state is forced if its only action is one reduction, so it reduces after a single bit test
+    of the input symbol against its lookahead mask. Input symbols outside the mask fall back to the action table,
+    so errors are reported at the same state and position as analysis, even where FOLLOW(A) is incomplete.
+    Gotos are precomputed for every (state, non-terminal) pair, chained through forced states
+    of one-symbol formulas like T->F, which only pass the value through.
+    """
+    def __init__(self, slr_map):
+        """
+        :param slr_map: SLRMap object, the analysis map to use.
+        """
+        grammar = slr_map.grammar
+        self.symbol_index, self.end_index, self.unknown_index, self.action = slr_map.encode_map()
+
+        # Every formula as (non_t, non_t's symbol index, length, FormulaType).
+        self.formulas = [(non_t, self.symbol_index[non_t], len(formula.split(' ')), get_formula_type(formula))
+                         for non_t, formula in grammar.formula_list]
+
+        # Index of the forced formula of every state, -1 if the state is not forced.
+        self.forced = [self.get_forced_formula(row) for row in self.action]
+
+        # Lookahead mask of every state, bit j is set if the forced formula is reduced on symbol index j.
+        self.lookahead = [self.get_lookahead_mask(row) if formula_index >= 0 else 0
+                          for row, formula_index in zip(self.action, self.forced)]
+
+        # Gotos in 'state -> non-terminal symbol index -> (state, non_t, chained reductions, lookahead mask)' format,
+        # None if no goto. The chained reductions only apply to input symbols in the mask.
+        non_t_indexes = [self.symbol_index[non_t] for non_t in grammar.non_ts]
+        self.goto = []
+        for state in range(len(self.action)):
+            row = [None] * len(grammar.symbols)
+            for non_t_index in non_t_indexes:
+                row[non_t_index] = self.get_chained_goto(grammar, state, non_t_index)
+            self.goto.append(row)
+
+        grammar.stats.incr('forced_states', len([f for f in self.forced if f >= 0]))
+
+    def get_forced_formula(self, row):
+        """
+        :param row: list, encoded map row.
+        :return: int, index of the formula the state always reduces, -1 if the state is not forced.
+        """
+        codes = {code for code in row if code != 0}
+        if len(codes) != 1:
+            return -1
+        code = codes.pop()
+        # Formula 0 is kept out, as its reduction is also the accept check.
+        if code >= -2:
+            return -1
+        return -code - 2
+
+    def get_lookahead_mask(self, row):
+        """
+        :param row: list, encoded map row.
+        :return: int, with bit j set if the row has any action on symbol index j.
+        """
+        mask = 0
+        for j, code in enumerate(row):
+            if code != 0:
+                mask |= 1 << j
+        return mask
+
+    def get_chained_goto(self, grammar, state, non_t_index):
+        """
+        :param grammar: Grammar object.
+        :param state: int, the state exposed after a reduction.
+        :param non_t_index: int, symbol index of the reduced non-terminal symbol.
+        :return: tuple, (state, non_t, chained reductions, lookahead mask) after the goto and all forced one-symbol
+            reductions following it, or None if there is no goto. The mask contains the input symbols
+            every chained reduction is reduced on, and all symbols if there is no chained reduction.
+        """
+        target = self.action[state][non_t_index] - 1
+        if target < 0:
+            return None
+        non_t = grammar.symbols[non_t_index]
+        count = 0
+        mask = -1
+        visited = set()
+        while self.forced[target] >= 0 and target not in visited:
+            formula_index = self.forced[target]
+            next_non_t, next_non_t_index, length, _ = self.formulas[formula_index]
+            next_target = self.action[state][next_non_t_index] - 1
+            if length != 1 or grammar.formula_list[formula_index][1] == 'e' or next_target < 0:
+                break
+            if mask & self.lookahead[target] == 0:
+                break
+            visited.add(target)
+            mask &= self.lookahead[target]
+            target, non_t = next_target, next_non_t
+            count += 1
+        return target, non_t, count, mask
@@ -0,0 +1,139 @@
+import csv
+import json
+import sys
+from collections import namedtuple
+
+# One analysis step. Instead of full stack snapshots, every row records the change it makes to the stacks:
+# 'pop' items are popped from both state and symbol stack, then 'push_state' and 'push_symbol' are pushed
+# if they are not None. 'input_pos' and 'input_symbol' are the position and content of current input symbol.
+TraceRow = namedtuple('TraceRow', ['step', 'action', 'pop', 'push_state', 'push_symbol',
+                                   'input_pos', 'input_symbol', 'quat'])
+
+
+class TraceSink:
+    """
+    Base class of trace sinks, receiving analysis steps one by one.
+    Ignores every step, so it can also be used to turn tracing off.
+    """
+    def begin(self, input_series):
+        """
+        Called at the beginning of analysis.
+
+        :param input_series: list, containing Mask objects of input series, ending with '#'.
+        """
+        pass
+
+    def write(self, row):
+        """
+        Called on every analysis step.
+
+        :param row: TraceRow object.
+        """
+        pass
+
+    def end(self):
+        """
+        Called at the end of analysis, whether the input series is valid or not.
+        """
+        pass
+
+
+class CallbackTraceSink(TraceSink):
+    """
+    Trace sink calling a function with every step.
+    """
+    def __init__(self, callback):
+        """
+        :param callback: function, called with one TraceRow object on every step.
+        """
+        self.callback = callback
+
+    def write(self, row):
+        self.callback(row)
+
+
+class CSVTraceSink(TraceSink):
+    """
+    Trace sink writing every step as one csv row.
+    """
+    def __init__(self, file, flush=False):
+        """
+        :param file: file object opened in text mode.
+        :param flush: bool, flush the file after every step or not.
+        """
+        self.file = file
+        self.flush = flush
+        self.writer = csv.writer(file, delimiter=',')
+
+    def begin(self, input_series):
+        self.writer.writerow(TraceRow._fields)
+
+    def write(self, row):
+        self.writer.writerow(['' if value is None else value for value in row])
+        if self.flush:
+            self.file.flush()
+
+
+class JSONLTraceSink(TraceSink):
+    """
+    Trace sink writing every step as one line of JSON.
+    """
+    def __init__(self, file, flush=False):
+        """
+        :param file: file object opened in text mode.
+        :param flush: bool, flush the file after every step or not.
+        """
+        self.file = file
+        self.flush = flush
+
+    def write(self, row):
+        self.file.write(json.dumps(row._asdict()) + '\n')
+        if self.flush:
+            self.file.flush()
+
+
+class ConsoleTraceSink(TraceSink):
+    """
+    Trace sink printing every step immediately in fixed width columns, like the trace printed by analysis.
+    Stacks are rebuilt from step changes, too long stacks and input series are cut to the width cap.
+    """
+    def __init__(self, width=40, file=None):
+        """
+        :param width: int, the max width of stack and input series columns.
+        :param file: file object to print to, sys.stdout if not given.
+        """
+        self.width = width
+        self.file = file
+        self.state_stack = []
+        self.symbol_stack = []
+        self.input_series = []
+        self.format_string = '{{:6}}{{:{0}}}{{:{0}}}{{:{0}}}{{:8}}{{}}'.format(width + 2)
+
+    def cut(self, string, keep_tail=True):
+        if len(string) <= self.width:
+            return string
+        if keep_tail:
+            return '...' + string[len(string) - self.width + 3:]
+        return string[:self.width - 3] + '...'
+
+    def begin(self, input_series):
+        self.state_stack = ['0']
+        self.symbol_stack = ['#']
+        self.input_series = [str(symbol) for symbol in input_series]
+        print(self.format_string.format('Step', 'State stack', 'Symbol stack', 'Input series', 'Action', 'Quat'),
+              file=self.file or sys.stdout)
+
+    def write(self, row):
+        # Only join items which can be shown, so that every step costs the same on long input series.
+        count = self.width + 1
+        print(self.format_string.format(str(row.step), self.cut(' '.join(self.state_stack[-count:])),
+                                        self.cut(''.join(self.symbol_stack[-count:])),
+                                        self.cut(''.join(self.input_series[row.input_pos:row.input_pos + count]),
+                                                 False),
+                                        row.action, row.quat), file=self.file or sys.stdout)
+        if row.pop > 0:
+            del self.state_stack[-row.pop:]
+            del self.symbol_stack[-row.pop:]
+        if row.push_state is not None:
+            self.state_stack.append(str(row.push_state))
+            self.symbol_stack.append(row.push_symbol)
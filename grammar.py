@@ -2,6 +2,8 @@ import pandas as pd
 from enum import Enum
 from copy import copy
 
+from stats import Stats
+
 
 def init_grammar(file, method="csv_file"):
     """
@@ -22,7 +24,7 @@ def init_grammar(file, method="csv_file"):
     if method == "txt_file":
         with open(file, "r") as txt_file:
             for line in txt_file.read().splitlines():
-                if len(line) == 2:
+                if len(line) == 2 or line.startswith('%'):
                     continue
                 non_t, formulas = line.split("->")
                 non_t = non_t.strip()
@@ -32,18 +34,52 @@ def init_grammar(file, method="csv_file"):
                     grammar_matrix.append(formula)
     elif method == "text":
         for line in file:
+            if line.startswith('%'):
+                continue
             non_t, formulas = line.split("->")
+            non_t = non_t.strip()
             for formula in formulas.split('|'):
                 index.append(non_t)
-                grammar_matrix.append(formula)
+                grammar_matrix.append(formula.strip())
     return pd.DataFrame(grammar_matrix, index=index, columns=["formula"])
 
 
+def init_precedence(file, method="csv_file"):
+    """
+    Read precedence and associativity declarations of terminal symbols, like '%left + -'.
+    Every declaration line is one precedence level, later lines have higher precedence.
+    Associativity can be 'left', 'right' or 'nonassoc'.
+
+    :param file: same as init_grammar.
+    :param method: same as init_grammar. There are no declarations in csv file.
+    :return: dict, in 'terminal symbol -> (level, associativity)' format.
+    :raise: ValueError when associativity is unknown.
+    """
+    if method == "csv_file":
+        return dict()
+    if method == "txt_file":
+        with open(file, "r") as txt_file:
+            file = txt_file.read().splitlines()
+    precedence = dict()
+    level = 0
+    for line in file:
+        if not line.startswith('%'):
+            continue
+        words = line.split()
+        assoc = words[0][1:]
+        if assoc not in ('left', 'right', 'nonassoc'):
+            raise ValueError("Unknown associativity declaration {}.".format(words[0]))
+        level += 1
+        for symbol in words[1:]:
+            precedence[symbol] = (level, assoc)
+    return precedence
+
+
 class Grammar:
     """
     Grammar class representing a grammar.
     """
-    def __init__(self, file, method, start_symbol=None):
+    def __init__(self, file, method, start_symbol=None, stats=None):
         """
         :param file: file directory or string list, based on what method to use. If method is "csv_file",
             'file' should be file directory of grammar csv file; if method is "txt_file",
@@ -51,9 +87,18 @@ class Grammar:
             'file' should be string list with every line contains one grammar formula.
         :param method: str, used to distinguish three different grammar initialization methods.
             Can be 'csv_file', 'txt_file' or 'text'.
+        :param stats: Stats object, used to record construction and analysis statistics.
+            A new one will be created if not given.
         """
+        if stats is None:
+            stats = Stats()
+        self.stats = stats
+
         grammar = init_grammar(file, method)
         self.grammar = grammar
+
+        # Precedence and associativity of terminal symbols, in 'symbol -> (level, associativity)' format.
+        self.precedence = init_precedence(file, method)
         self.non_ts = grammar[~grammar.index.duplicated(keep='first')].index
 
         # first_dict is a python dict used to store FIRST(a) array corresponding to one non-terminal symbol and formula.
@@ -64,12 +109,14 @@ class Grammar:
         # The dict's form is non-terminal -> FOLLOW(a) set.
         self.follow_dict = dict()
 
-        self.construct_first()
+        with self.stats.phase('construct_first'):
+            self.construct_first()
 
         if start_symbol is None:
             start_symbol = grammar.index[0]
         self.start_symbol = start_symbol
-        self.construct_follow(start_symbol)
+        with self.stats.phase('construct_follow'):
+            self.construct_follow(start_symbol)
 
         self.formula_list, self.symbols = self.get_symbol_formula_list()
 
@@ -285,6 +332,193 @@ class Grammar:
                             except KeyError:
                                 continue
 
+    def add_formula(self, non_t, formula):
+        """
+        Add one formula to this grammar, updating only affected FIRST(a) and FOLLOW(A) arrays.
+
+        :param non_t: str, non-terminal symbol of the formula, can be a new one.
+        :param formula: str, formula content, symbols separated by ' '.
+        :return: set, non-terminal symbols whose FOLLOW(A) array is changed.
+        :raise: ValueError when the formula is not valid (see normalize_formula), already in grammar,
+            or it uses an undefined non-terminal symbol.
+        """
+        non_t, formula = normalize_formula(non_t, formula)
+        if (non_t, formula) in self.formula_list:
+            raise ValueError("Formula {}->{} is already in grammar.".format(non_t, formula))
+        for symbol in formula.split(' '):
+            if symbol.isupper() and symbol != non_t and symbol not in self.non_ts:
+                raise ValueError("Non-terminal symbol {} in {}->{} is not defined.".format(symbol, non_t, formula))
+        self.grammar = pd.concat([self.grammar, pd.DataFrame([formula], index=[non_t], columns=["formula"])])
+        return self.update_first_follow(non_t, formula)
+
+    def remove_formula(self, non_t, formula):
+        """
+        Remove one formula from this grammar, updating only affected FIRST(a) and FOLLOW(A) arrays.
+
+        :param non_t: str, non-terminal symbol of the formula.
+        :param formula: str, formula content, symbols separated by ' '.
+        :return: set, non-terminal symbols whose FOLLOW(A) array is changed.
+        :raise: ValueError when the formula is not valid (see normalize_formula), not in grammar,
+            or it is the last formula of start symbol or of a non-terminal symbol used in other formulas.
+        """
+        non_t, formula = normalize_formula(non_t, formula)
+        if (non_t, formula) not in self.formula_list:
+            raise ValueError("Formula {}->{} is not in grammar.".format(non_t, formula))
+        if len(self.get_all_formulas(non_t)) == 1:
+            if non_t == self.start_symbol:
+                raise ValueError("Can't remove the last formula of start symbol.")
+            for non_terminal, f in self.formula_list:
+                if non_terminal != non_t and non_t in f.split(' '):
+                    raise ValueError("Can't remove the last formula of {}, it is used in {}->{}.".format(
+                        non_t, non_terminal, f))
+        self.grammar = self.grammar[~((self.grammar.index == non_t) & (self.grammar["formula"] == formula))]
+        return self.update_first_follow(non_t, formula)
+
+    def get_first_dependents(self, non_t):
+        """
+        :param non_t: str, non-terminal symbol.
+        :return: set, containing non_t and all non-terminal symbols whose FIRST(a) arrays are built from non_t's.
+        """
+        # Dependency in 'non-terminal -> non-terminals whose FIRST(a) is built from it' format.
+        dependents = dict()
+        for non_terminal, formula in self.formula_list:
+            for symbol in formula.split(' '):
+                if not symbol.isupper():
+                    break
+                dependents.setdefault(symbol, set()).add(non_terminal)
+                if symbol not in self.non_ts or 'e' not in list(self.get_all_formulas(symbol)):
+                    break
+        result = {non_t}
+        stack = [non_t]
+        while len(stack) > 0:
+            for dependent in dependents.get(stack.pop(), ()):
+                if dependent not in result:
+                    result.add(dependent)
+                    stack.append(dependent)
+        return result
+
+    def update_first_follow(self, non_t, formula):
+        """
+        Update formula list, symbols, FIRST(a) and FOLLOW(A) arrays after formula non_t->formula is added or removed.
+        Only FIRST(a) of non-terminal symbols built from non_t's are recomputed, then only FOLLOW(A)
+        which can be changed by the formula or by those FIRST(a). Adding or removing an empty formula changes
+        which symbols can be inferred to empty, all arrays are recomputed in that case.
+
+        :param non_t: str, non-terminal symbol of the changed formula.
+        :param formula: str, content of the changed formula.
+        :return: set, non-terminal symbols whose FOLLOW(A) array is changed.
+        """
+        self.non_ts = self.grammar[~self.grammar.index.duplicated(keep='first')].index
+        self.formula_list, self.symbols = self.get_symbol_formula_list()
+        old_follow = {non_terminal: set(follow) for non_terminal, follow in self.follow_dict.items()}
+
+        if formula == 'e':
+            self.first_dict = dict()
+            self.follow_dict = dict()
+            with self.stats.phase('construct_first'):
+                self.construct_first()
+            with self.stats.phase('construct_follow'):
+                self.construct_follow(self.start_symbol)
+            return {n for n in set(self.non_ts) | set(old_follow) if old_follow.get(n) != self.follow_dict.get(n)}
+
+        with self.stats.phase('update_first'):
+            first_affected = self.get_first_dependents(non_t)
+            old_first = dict()
+            for (non_terminal, f) in list(self.first_dict.keys()):
+                if non_terminal in first_affected:
+                    old_first.setdefault(non_terminal, set()).update(self.first_dict.pop((non_terminal, f)))
+            first_affected &= set(self.non_ts)
+            for non_terminal in first_affected:
+                self.get_first(non_terminal)
+            for non_terminal in first_affected:
+                self.append_first(non_terminal)
+            first_changed = {non_terminal for non_terminal in first_affected | set(old_first)
+                             if old_first.get(non_terminal) != self.get_first_set(non_terminal)}
+            self.stats.incr('first_recomputed', len(first_affected))
+
+        with self.stats.phase('update_follow'):
+            # The changed non-terminal, non-terminals in the formula,
+            # and those followed by a non-terminal whose FIRST(a) is changed.
+            follow_affected = {non_t} | {s for s in formula.split(' ') if s.isupper()}
+            for non_terminal, f in self.formula_list:
+                symbols = f.split(' ')
+                for left, right in zip(symbols, symbols[1:]):
+                    if left.isupper() and right in first_changed:
+                        follow_affected.add(left)
+            # FOLLOW(A) is passed to the last non-terminals of A's formulas.
+            changed = True
+            while changed:
+                changed = False
+                for non_terminal, f in self.formula_list:
+                    if non_terminal not in follow_affected:
+                        continue
+                    for symbol in reversed(f.split(' ')):
+                        if not symbol.isupper():
+                            break
+                        if symbol not in follow_affected:
+                            follow_affected.add(symbol)
+                            changed = True
+                        if 'e' not in list(self.get_all_formulas(symbol)):
+                            break
+            for non_terminal in old_follow:
+                if non_terminal not in self.non_ts:
+                    del self.follow_dict[non_terminal]
+            follow_affected &= set(self.non_ts)
+            for non_terminal in follow_affected:
+                self.get_follow(non_terminal, self.start_symbol)
+            for i in range(len(follow_affected)):
+                for non_terminal in follow_affected:
+                    self.append_follow(non_terminal)
+            self.stats.incr('follow_recomputed', len(follow_affected))
+        return {n for n in set(self.non_ts) | set(old_follow) if old_follow.get(n) != self.follow_dict.get(n)}
+
+    def get_first_set(self, non_t):
+        """
+        :param non_t: str, non-terminal symbol.
+        :return: set, union of FIRST(a) arrays of all non_t's formulas, None if non_t has no formula.
+        """
+        result = None
+        for (non_terminal, formula), first in self.first_dict.items():
+            if non_terminal == non_t:
+                result = set(first) if result is None else result | first
+        return result
+
+    def get_formula_precedence(self, formula):
+        """
+        A formula's precedence is the precedence of its rightmost terminal symbol which has one.
+
+        :param formula: str, formula content.
+        :return: tuple, (level, associativity), or None if no terminal symbol in formula has precedence.
+        """
+        for symbol in reversed(formula.split(' ')):
+            if symbol in self.precedence:
+                return self.precedence[symbol]
+        return None
+
+    def resolve_conflict(self, formula, symbol):
+        """
+        Resolve a conflict between reducing a formula and moving in a symbol by precedence declarations.
+
+        :param formula: str, content of the formula to reduce.
+        :param symbol: str, the next input symbol to move in.
+        :return: str, 'S' to move in, 'R' to reduce, '' to report error (non-associative),
+            or None if the formula or the symbol has no precedence.
+        """
+        formula_precedence = self.get_formula_precedence(formula)
+        if formula_precedence is None or symbol not in self.precedence:
+            return None
+        formula_level, assoc = formula_precedence
+        symbol_level = self.precedence[symbol][0]
+        if formula_level > symbol_level:
+            return 'R'
+        elif formula_level < symbol_level:
+            return 'S'
+        elif assoc == 'left':
+            return 'R'
+        elif assoc == 'right':
+            return 'S'
+        return ''
+
     def print_grammar(self, flat=False):
         """
         Print out grammar formulas.
@@ -297,6 +531,99 @@ class Grammar:
         else:
             print(str(self) + '\n')
 
+    def get_productions(self):
+        """
+        :return: dict, in 'non-terminal symbol -> list of formulas' format, in the order of non_ts.
+        """
+        return {non_t: list(self.get_all_formulas(non_t)) for non_t in self.non_ts}
+
+    def to_text(self, productions=None):
+        """
+        :param productions: dict, in 'non-terminal symbol -> list of formulas' format. Use this grammar's if not given.
+        :return: list, containing precedence declaration lines and one 'A->formula|formula' line
+            per non-terminal symbol, which can be used to create a Grammar with 'text' method.
+        """
+        if productions is None:
+            productions = self.get_productions()
+        levels = dict()
+        for symbol, (level, assoc) in self.precedence.items():
+            levels.setdefault(level, ['%' + assoc]).append(symbol)
+        return [' '.join(levels[level]) for level in sorted(levels)] + \
+            ['{}->{}'.format(non_t, '|'.join(formulas)) for non_t, formulas in productions.items() if len(formulas) > 0]
+
+    def remove_useless_symbols(self, productions=None):
+        """
+        Remove formulas containing non-terminal symbols which can't derive terminal strings,
+        then non-terminal symbols which can't be reached from the start symbol.
+
+        :param productions: dict, in 'non-terminal symbol -> list of formulas' format. Use this grammar's if not given.
+        :return: dict, the productions without useless symbols.
+        """
+        if productions is None:
+            productions = self.get_productions()
+
+        # Find all non-terminal symbols which can derive terminal strings.
+        generating = set()
+        changed = True
+        while changed:
+            changed = False
+            for non_t, formulas in productions.items():
+                if non_t in generating:
+                    continue
+                for formula in formulas:
+                    if all(not s.isupper() or s in generating for s in formula.split(' ')):
+                        generating.add(non_t)
+                        changed = True
+                        break
+        productions = {non_t: [f for f in formulas if all(not s.isupper() or s in generating for s in f.split(' '))]
+                       for non_t, formulas in productions.items() if non_t in generating}
+
+        # Find all non-terminal symbols which can be reached from the start symbol.
+        reachable = {self.start_symbol}
+        stack = [self.start_symbol]
+        while len(stack) > 0:
+            for formula in productions.get(stack.pop(), []):
+                for s in formula.split(' '):
+                    if s.isupper() and s not in reachable:
+                        reachable.add(s)
+                        stack.append(s)
+        return {non_t: formulas for non_t, formulas in productions.items() if non_t in reachable}
+
+    def eliminate_unit_productions(self, units=None, stats=None):
+        """
+        Create an equivalent grammar without unit formulas like E->T, and without useless symbols.
+        Every eliminated unit formula A->B is replaced by all formulas of B, except B's eliminated unit formulas,
+        which are replaced in the same way.
+        Unit formulas only pass values through in analysis, so quaternary formulas are not changed.
+
+        :param units: list, containing (non_t, formula) tuples of unit formulas to eliminate.
+            Eliminate all if not given.
+        :param stats: Stats object of the new grammar. Share this grammar's stats if not given.
+        :return: Grammar object, the new grammar.
+        """
+        if units is None:
+            units = [(non_t, formula) for non_t, formula in self.formula_list if is_unit_formula(formula)]
+        units = set(units)
+        productions = self.get_productions()
+        result = dict()
+        for non_t in productions.keys():
+            # Find all non-terminal symbols non_t can reach by eliminated unit formulas, in the order they are found.
+            reached = [non_t]
+            i = 0
+            while i < len(reached):
+                for formula in productions.get(reached[i], []):
+                    if (reached[i], formula) in units and formula not in reached:
+                        reached.append(formula)
+                i += 1
+            formulas = []
+            for symbol in reached:
+                for formula in productions.get(symbol, []):
+                    if (symbol, formula) not in units and formula not in formulas:
+                        formulas.append(formula)
+            result[non_t] = formulas
+        result = self.remove_useless_symbols(result)
+        return Grammar(self.to_text(result), 'text', self.start_symbol, self.stats if stats is None else stats)
+
 
 class FormulaType(Enum):
     EQUAL = 1,  # Like A->V=E
@@ -306,6 +633,32 @@ class FormulaType(Enum):
     BRACKET = 5,  # Like F->(E)
 
 
+def normalize_formula(non_t, formula):
+    """
+    Normalize a formula given by user, separating its symbols by exactly one ' '.
+
+    :param non_t: str, non-terminal symbol of the formula.
+    :param formula: str, formula content.
+    :return: tuple, (non_t, formula) normalized.
+    :raise: ValueError when the non-terminal symbol is not one upper case symbol, or the formula is empty.
+    """
+    non_t = non_t.strip()
+    formula = ' '.join(formula.split())
+    if len(non_t) == 0 or not non_t.isupper() or len(non_t.split()) != 1:
+        raise ValueError("Left side {} of a formula must be one non-terminal symbol.".format(non_t))
+    if len(formula) == 0:
+        raise ValueError("Formula of {} is empty, use e for an empty formula.".format(non_t))
+    return non_t, formula
+
+
+def is_unit_formula(formula):
+    """
+    :param formula: str, the content of formula.
+    :return: bool, true if the formula is just one non-terminal symbol, like 'T' in E->T.
+    """
+    return ' ' not in formula and formula.isupper()
+
+
 def get_formula_type(formula):
     """
     Returns the type of formula.
@@ -1,6 +1,11 @@
+import sys
+
 from grammar import Grammar
 from SLRAn import SLRAn, str2masks
 from LexAn import split_input_string
+from SLRTrace import CSVTraceSink, JSONLTraceSink
+from QuadBuffer import QuadBuffer
+from SLRExport import SparseTable, write_sparse_csv, write_sparse_binary, diff_tables
 
 
 class Main(SLRAn):
@@ -44,19 +49,121 @@ class Main(SLRAn):
                 except (ValueError, KeyError) as e:
                     print("Invalid input string.\n", e)
                 print()
+            elif choice[0] == 'fast':
+                if len(choice) < 2:
+                    print('Please input the string to analysis after order fast.')
+                    continue
+                input_string = ' '.join(choice[1:])
+                quads = QuadBuffer()
+                try:
+                    self.fast_analysis(str2masks(split_input_string(input_string)), quads, verify=True)
+                    quads.write_text(sys.stdout)
+                    print("Valid input string.")
+                except (ValueError, KeyError) as e:
+                    print("Invalid input string.\n", e)
+                print()
+            elif choice[0] == 'trace':
+                if len(choice) < 3:
+                    print('Please input the file name and the string to analysis after order trace.')
+                    continue
+                file_name = choice[1]
+                input_string = ' '.join(choice[2:])
+                with open(file_name, 'w', newline='') as file:
+                    sink = JSONLTraceSink(file) if file_name.endswith('.jsonl') else CSVTraceSink(file)
+                    try:
+                        self.analysis(str2masks(split_input_string(input_string)), trace=sink)
+                        print("Valid input string.")
+                    except (ValueError, KeyError) as e:
+                        print("Invalid input string.\n", e)
+                print("Trace written to {}".format(file_name), '\n')
+            elif choice[0] == 'add' or choice[0] == 'remove':
+                formula = ' '.join(choice[1:])
+                if '->' not in formula:
+                    print('Please input the formula like E->E + T after order {}.'.format(choice[0]))
+                    continue
+                non_t, formula = formula.split('->', 1)
+                try:
+                    if choice[0] == 'add':
+                        result = self.add_formula(non_t.strip(), formula.strip())
+                    else:
+                        result = self.remove_formula(non_t.strip(), formula.strip())
+                    print('{} states reused, {} states re-derived, {} rows patched.\n'.format(
+                        result['states_reused'], result['states_rederived'], result['rows_patched']))
+                except ValueError as e:
+                    print("Grammar not changed.\n", e)
             elif choice[0] == 'csv':
                 file_name = 'map.csv'
                 if len(choice) > 1:
                     file_name = choice[1]
                 self.export_to_csv(file_name)
                 print("Exported to {}".format(file_name), '\n')
+            elif choice[0] == 'sparse':
+                if len(choice) < 2:
+                    print('Please input the file name after order sparse.')
+                    continue
+                file_name = choice[1]
+                if file_name.endswith('.bin'):
+                    with open(file_name, 'wb') as file:
+                        write_sparse_binary(self, file)
+                else:
+                    with open(file_name, 'w', newline='') as file:
+                        write_sparse_csv(self, file)
+                print("Exported to {}".format(file_name), '\n')
+            elif choice[0] == 'diff':
+                if len(choice) < 2:
+                    print('Please input the binary table file name after order diff.')
+                    continue
+                try:
+                    with open(choice[1], 'rb') as file:
+                        result = diff_tables(SparseTable.read_binary(file), self)
+                except (OSError, ValueError) as e:
+                    print("Can't compare tables.\n", e)
+                    continue
+                print('States removed: {}'.format(' '.join('S{}'.format(i) for i in result['states_removed'])))
+                print('States added: {}'.format(' '.join('S{}'.format(i) for i in result['states_added'])))
+                for change in result['changes']:
+                    # Shifts are shown with target kernels, as equal state numbers can mean different states.
+                    actions = []
+                    for action, target in [(change.old_action, change.old_target),
+                                           (change.new_action, change.new_target)]:
+                        if target is not None:
+                            action = '{} {{{}}}'.format(action, ', '.join(target))
+                        actions.append(action or '-')
+                    print('{:6}{:6}{:4}{:6} -> {}'.format('S{}'.format(change.old_state),
+                                                          'S{}'.format(change.new_state),
+                                                          change.symbol, actions[0], actions[1]))
+                print()
+            elif choice[0] == 'stats':
+                stats = self.grammar.stats
+                if len(choice) > 1 and choice[1] == 'reset':
+                    stats.reset()
+                    print('Statistics cleared.\n')
+                elif len(choice) > 1 and choice[1] == 'profile':
+                    if len(choice) > 2:
+                        stats.profile = choice[2] == 'on'
+                        print('Profiling turned {}.\n'.format('on' if stats.profile else 'off'))
+                    else:
+                        profile = stats.get_profile()
+                        print(profile if len(profile) > 0 else 'Nothing profiled, use stats profile on first.\n')
+                else:
+                    stats.print_stats()
             elif choice[0] == 'help':
-                format_string = '\t{:15}{}'
+                format_string = '\t{:28}{}'
                 print(format_string.format('grammar', 'Print out grammar details'))
                 print(format_string.format('ps', 'Print out project sets'))
                 print(format_string.format('map', 'Print out analysis map'))
                 print(format_string.format('csv <filename>', 'Export analysis map to csv file'))
+                print(format_string.format('sparse <filename>', 'Export non-empty map cells to csv or .bin file'))
+                print(format_string.format('diff <filename>', 'Compare a .bin map file with current map by kernel'))
                 print(format_string.format('an <series>', 'Analysis series'))
+                print(format_string.format('add <formula>', 'Add a formula like F->- F, patching analysis map'))
+                print(format_string.format('remove <formula>', 'Remove a formula, patching analysis map'))
+                print(format_string.format('fast <series>', 'Analysis series on fast path, verified by an'))
+                print(format_string.format('trace <filename> <series>',
+                                           'Analysis series, streaming steps to csv or jsonl file'))
+                print(format_string.format('stats', 'Print out phase timings and counters'))
+                print(format_string.format('stats reset', 'Clear statistics'))
+                print(format_string.format('stats profile', 'Print out profile, or turn it on/off'))
                 print(format_string.format('exit', 'Quit this program'))
             elif choice[0] == 'exit':
                 exit(0)
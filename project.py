@@ -1,6 +1,15 @@
 from copy import copy
 from enum import Enum
 from collections import Counter
+import sys
+
+
+def get_formula_symbols(formula):
+    """
+    :param formula: str, formula content.
+    :return: list, containing the formula's symbols, interned so that projects of all grammars share them.
+    """
+    return [sys.intern(symbol) for symbol in formula.split(' ')]
 
 
 class Project:
@@ -35,6 +44,14 @@ class Project:
     def __hash__(self) -> int:
         return hash((self.non_t, tuple(self.symbols), self.pos))
 
+    def get_key(self):
+        """
+        Unlike str, symbols are separated by ' ', so that projects with multi-character symbols never look the same.
+
+        :return: str, this project like 'E -> E + . T'.
+        """
+        return ' '.join([self.non_t, '->'] + self.symbols[:self.pos] + ['.'] + self.symbols[self.pos:])
+
     def get_state(self):
         """
         Get project's current state.
@@ -151,10 +168,21 @@ class ProjectSet:
         else:
             return self.ProjectSetState.BOTH
 
+    def get_kernel(self):
+        """
+        Get kernel projects of this project set, which are projects not added by closure operation.
+
+        :return: list, containing kernel Project objects.
+        """
+        if self.index == 0:
+            return [p for p in self.project_list if p.pos > 0 or p.non_t == self.grammar.start_symbol]
+        return [p for p in self.project_list if p.pos > 0]
+
     def closure(self):
         """
         Process closure operation.
         """
+        self.grammar.stats.incr('closure_calls')
         changed = True  # Indicate whether there are new Projects added.
         while changed:
             changed = False
@@ -162,7 +190,7 @@ class ProjectSet:
                 if p.get_state() == Project.ProjectState.WAIT:
                     non_t = p.get_next()
                     for formula in self.grammar.get_all_formulas(non_t):
-                        new_project = Project(non_t, formula.split(' '))
+                        new_project = Project(non_t, get_formula_symbols(formula))
                         if new_project not in self.project_list:
                             changed = True
                             self.project_list.append(new_project)
@@ -178,6 +206,7 @@ class ProjectSet:
         :raise: ValueError when there are no Project who can read the given symbol
             or project set is in statute state.
         """
+        self.grammar.stats.incr('goto_calls')
         new_project_list = []
         if self.get_state() != self.ProjectSetState.STATUTE:
             for p in self.project_list:
@@ -207,19 +236,26 @@ class ProjectSet:
     def process_double(self):
         """
         Function specially designed for project set which are in 'BOTH' or 'STATUTE' state.
+        Conflicts between statute projects and move in projects are allowed if they can be resolved
+        by precedence declarations, see Grammar.resolve_conflict.
 
         :return: dict, covering all projects in statute state,
             each item in 'Project -> input_symbol' format.
-        :raise: ValueError when project set is not in BOTH state, which is not applicable to use this function.
+        :raise: ValueError when there are conflicts between statute projects,
+            or between statute projects and move in projects which can't be resolved by precedence.
         """
         result = dict()
-        all_symbols = set(self.get_all_readable())
+        readable = set(self.get_all_readable())
+        statute_symbols = set()
         for p in self.project_list:
             if p.get_state() == Project.ProjectState.STATUTE:
                 follow_set = self.grammar.follow_dict[p.non_t]
-                if not all_symbols.isdisjoint(follow_set):
-                    raise ValueError("Find same next symbol between statute projects and move in projects.")
-                all_symbols |= follow_set
+                if not statute_symbols.isdisjoint(follow_set):
+                    raise ValueError("Find same next symbol between statute projects.")
+                for symbol in readable & follow_set:
+                    if self.grammar.resolve_conflict(' '.join(p.symbols), symbol) is None:
+                        raise ValueError("Find same next symbol between statute projects and move in projects.")
+                statute_symbols |= follow_set
                 result[p] = follow_set
         return result
 
@@ -242,5 +278,5 @@ def get_init_ps(grammar):
     project_list = []
     start_symbol = grammar.start_symbol
     for formula in grammar.get_all_formulas(start_symbol):
-        project_list.append(Project(start_symbol, formula.split(' ')))
+        project_list.append(Project(start_symbol, get_formula_symbols(formula)))
     return ProjectSet(grammar, project_list, 0)
@@ -0,0 +1,146 @@
+import hashlib
+import sys
+from collections import OrderedDict
+
+import pandas as pd
+
+from grammar import Grammar
+from SLRAn import SLRAn
+from stats import Stats, get_deep_size
+
+
+def get_grammar_lines(text):
+    """
+    Normalize grammar text into formula lines, dropping blank lines and surrounding spaces.
+
+    :param text: str or list, grammar text with one formula per line, or list of such lines.
+    :return: list, containing normalized formula lines.
+    """
+    if isinstance(text, str):
+        text = text.splitlines()
+    return [line.strip() for line in text if len(line.strip()) > 0]
+
+
+def get_fingerprint(text):
+    """
+    :param text: str or list, grammar text with one formula per line, or list of such lines.
+    :return: str, fingerprint of the normalized grammar text.
+    """
+    return hashlib.sha1('\n'.join(get_grammar_lines(text)).encode()).hexdigest()
+
+
+def intern_grammar(grammar):
+    """
+    Intern all symbols and formulas of a grammar, so that grammars in the same registry share them.
+    Symbols of projects and kernels are interned when they are created, see get_formula_symbols and SLRMap.make_lean.
+
+    :param grammar: Grammar object.
+    """
+    grammar.symbols = [sys.intern(symbol) for symbol in grammar.symbols]
+    grammar.formula_list = [(sys.intern(non_t), sys.intern(formula)) for non_t, formula in grammar.formula_list]
+    grammar.grammar = pd.DataFrame([formula for _, formula in grammar.formula_list],
+                                   index=[non_t for non_t, _ in grammar.formula_list],
+                                   columns=["formula"], dtype=object)
+    grammar.non_ts = grammar.grammar[~grammar.grammar.index.duplicated(keep='first')].index
+    grammar.first_dict = {(sys.intern(non_t), sys.intern(formula)): {sys.intern(symbol) for symbol in first}
+                          for (non_t, formula), first in grammar.first_dict.items()}
+    grammar.follow_dict = {sys.intern(non_t): {sys.intern(symbol) for symbol in follow}
+                           for non_t, follow in grammar.follow_dict.items()}
+
+
+def get_table_size(slr_map):
+    """
+    Approximate table memory of an SLR map, including its project sets if they are not dropped.
+
+    :param slr_map: SLRMap object.
+    :return: int, size in bytes.
+    """
+    return get_deep_size([slr_map.map, slr_map.kernels, slr_map.ps_list, slr_map.ps_dict, slr_map.read_dict],
+                         exclude=[slr_map.grammar])
+
+
+class GrammarRegistry:
+    """
+    In-memory registry of compiled analyzers, keyed by grammar text fingerprint.
+
+    Analyzers are built on first use and kept in a least recently used order.
+    When total table memory exceeds the limit, least recently used analyzers are evicted.
+    """
+    def __init__(self, max_bytes=64 * 1024 * 1024, lean=True):
+        """
+        :param max_bytes: int, the limit of total table memory in bytes.
+        :param lean: bool, build analyzers in lean mode or not, see SLRMap.
+        """
+        self.max_bytes = max_bytes
+        self.lean = lean
+
+        # Compiled analyzers, in 'fingerprint -> (SLRAn object, table bytes)' format,
+        # ordered from least to most recently used.
+        self.analyzers = OrderedDict()
+        self.total_bytes = 0
+
+        # Hits, misses, evictions and build time of this registry.
+        self.stats = Stats()
+
+    def __len__(self):
+        return len(self.analyzers)
+
+    def __contains__(self, text):
+        return get_fingerprint(text) in self.analyzers
+
+    def get(self, text):
+        """
+        Get the analyzer of a grammar, building it if it is not in the registry.
+
+        :param text: str or list, grammar text with one formula per line, or list of such lines.
+        :return: SLRAn object.
+        """
+        fingerprint = get_fingerprint(text)
+        if fingerprint in self.analyzers:
+            self.stats.incr('hits')
+            self.analyzers.move_to_end(fingerprint)
+            return self.analyzers[fingerprint][0]
+
+        self.stats.incr('misses')
+        with self.stats.phase('build'):
+            grammar = Grammar(get_grammar_lines(text), 'text')
+            intern_grammar(grammar)
+            analyzer = SLRAn(grammar, self.lean)
+        size = get_table_size(analyzer)
+        self.analyzers[fingerprint] = (analyzer, size)
+        self.total_bytes += size
+        self.evict()
+        return analyzer
+
+    def evict(self):
+        """
+        Evict least recently used analyzers until total table memory is under the limit.
+        The most recently used analyzer is always kept.
+        """
+        while self.total_bytes > self.max_bytes and len(self.analyzers) > 1:
+            _, (_, size) = self.analyzers.popitem(last=False)
+            self.total_bytes -= size
+            self.stats.incr('evictions')
+
+    def remove(self, text):
+        """
+        Remove the analyzer of a grammar from the registry.
+
+        :param text: str or list, grammar text with one formula per line, or list of such lines.
+        :raise: KeyError when the grammar is not in the registry.
+        """
+        _, size = self.analyzers.pop(get_fingerprint(text))
+        self.total_bytes -= size
+
+    def get_metrics(self):
+        """
+        :return: dict, containing hits, misses, evictions, analyzer count and memory usage.
+        """
+        return {
+            'hits': self.stats.counters['hits'],
+            'misses': self.stats.counters['misses'],
+            'evictions': self.stats.counters['evictions'],
+            'analyzers': len(self.analyzers),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+        }
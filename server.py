@@ -0,0 +1,219 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from io import StringIO
+
+from grammar import Grammar
+from SLRAn import SLRAn, str2masks
+from LexAn import split_input_string
+
+# Analyzers resident in the current process, in 'grammar name -> SLRAn' format.
+# Filled once in every worker process of the pool, and once in the server process so that bad grammar files
+# are reported before serving.
+analyzers = dict()
+
+
+def load_analyzers(grammar_files, lean=False):
+    """
+    Build one analyzer for every grammar and keep it resident in this process.
+
+    :param grammar_files: dict, in 'grammar name -> grammar plain text file directory' format.
+    :param lean: bool, build analyzers in lean mode or not, see SLRMap.
+    """
+    for name, file in grammar_files.items():
+        analyzers[name] = SLRAn(Grammar(file, 'txt_file'), lean)
+
+
+def get_pid():
+    """
+    :return: int, id of the current process, used to check that worker processes are started.
+    """
+    return os.getpid()
+
+
+def run_command(name, command, argument='', trace=False):
+    """
+    Run one command against a resident analyzer, capturing everything it prints.
+
+    :param name: str, name of the grammar to use.
+    :param command: str, can be 'an', 'map' or 'grammar', same as orders in Main.control.
+    :param argument: str, the input string to analysis when command is 'an'.
+    :param trace: bool, when command is 'an', run analysis and return its printed trace,
+        otherwise run fast_analysis and only return the error message of an invalid input string.
+    :return: dict, containing 'output' text, and 'valid' flag when command is 'an'.
+    :raise: ValueError when grammar name or command is unknown.
+    """
+    if name not in analyzers:
+        raise ValueError("Grammar {} is not loaded.".format(name))
+    analyzer = analyzers[name]
+    result = dict()
+    output = StringIO()
+    with redirect_stdout(output):
+        if command == 'an':
+            try:
+                if trace:
+                    analyzer.analysis(str2masks(split_input_string(argument)))
+                else:
+                    analyzer.fast_analysis(str2masks(split_input_string(argument)))
+                result['valid'] = True
+            except (ValueError, KeyError) as e:
+                print(e)
+                result['valid'] = False
+        elif command == 'map':
+            analyzer.print_map()
+        elif command == 'grammar':
+            analyzer.grammar.print_grammar(flat=True)
+            print()
+            analyzer.grammar.print_follow()
+        else:
+            raise ValueError("Unknown command {}.".format(command))
+    result['output'] = output.getvalue()
+    return result
+
+
+class ParseServer:
+    """
+    Local asyncio server keeping compiled analyzers warm between requests.
+
+    Every request is one line of JSON like {"id": 1, "grammar": "default", "cmd": "an", "input": "a = b + c"},
+    every response is one line of JSON carrying the same id, the result or error, and the request latency.
+    Analysis trace is only returned in 'output' if the request has "trace": true.
+    Requests on one connection can be pipelined, responses are written back in request order.
+    """
+    def __init__(self, grammar_files, workers=None, lean=False):
+        """
+        :param grammar_files: dict, in 'grammar name -> grammar plain text file directory' format.
+        :param workers: int, process count of the worker pool used for analysis. None to use CPU count.
+        :param lean: bool, build analyzers in lean mode or not, see SLRMap.
+        """
+        self.grammar_files = grammar_files
+        load_analyzers(grammar_files, lean)
+        if workers is None:
+            workers = os.cpu_count() or 1
+        # Spawned workers don't inherit file descriptors of the server process, like open client sockets.
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=load_analyzers, initargs=(grammar_files, lean))
+        self.start_workers(workers)
+
+    def start_workers(self, workers):
+        """
+        Start all worker processes and wait until every one has built its analyzers,
+        so that the first requests don't pay for process start and grammar construction.
+
+        :param workers: int, process count of the worker pool.
+        :raise: RuntimeError when some worker processes don't answer.
+        """
+        pids = set()
+        # A started worker may take several tasks while others are still building, so retry until all answer.
+        for _ in range(100):
+            futures = [self.pool.submit(get_pid) for _ in range(workers)]
+            pids.update(future.result() for future in futures)
+            if len(pids) >= workers:
+                return
+        raise RuntimeError("Only {} of {} worker processes are started.".format(len(pids), workers))
+
+    async def handle_request(self, line):
+        """
+        Handle one request line.
+
+        :param line: bytes, one raw request line.
+        :return: dict, the response to send back.
+        """
+        start = time.perf_counter()
+        response = dict()
+        try:
+            request = json.loads(line)
+            response['id'] = request.get('id')
+            name = request.get('grammar', 'default')
+            command = request.get('cmd', 'an')
+            # Analysis and printing out maps are CPU-bound, hand them over to the worker pool.
+            result = await asyncio.get_running_loop().run_in_executor(
+                self.pool, run_command, name, command, request.get('input', ''), bool(request.get('trace', False)))
+            response['ok'] = True
+            response.update(result)
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = str(e)
+        response['latency_ms'] = round((time.perf_counter() - start) * 1000, 3)
+        return response
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve one client connection until it is closed by the client.
+        """
+        # Queue of pending response futures, kept in request order.
+        pending = asyncio.Queue()
+
+        async def respond():
+            while True:
+                task = await pending.get()
+                if task is None:
+                    break
+                try:
+                    writer.write(json.dumps(await task).encode() + b'\n')
+                    await writer.drain()
+                except ConnectionError:
+                    # The client is gone, remaining responses are dropped.
+                    break
+
+        responder = asyncio.ensure_future(respond())
+        while True:
+            try:
+                line = await reader.readline()
+            except ConnectionError:
+                break
+            if len(line) == 0:
+                break
+            if len(line.strip()) == 0:
+                continue
+            pending.put_nowait(asyncio.ensure_future(self.handle_request(line)))
+        pending.put_nowait(None)
+        await responder
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    async def serve(self, path=None, host='127.0.0.1', port=8765):
+        """
+        Start serving forever.
+
+        :param path: str, Unix socket path. If set, host and port are ignored.
+        :param host: str, TCP host to bind.
+        :param port: int, TCP port to bind.
+        """
+        if path is not None:
+            server = await asyncio.start_unix_server(self.handle_connection, path=path)
+        else:
+            server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve SLR(1) analysis requests over a local socket.')
+    parser.add_argument('grammars', nargs='*', default=['default=grammar.txt'],
+                        help='grammars to load, in name=file format')
+    parser.add_argument('--unix', help='Unix socket path to listen on')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--workers', type=int, default=None, help='worker process count')
+    parser.add_argument('--lean', action='store_true', help='drop project sets after map construction')
+    args = parser.parse_args()
+
+    parse_server = ParseServer(dict(g.split('=', 1) for g in args.grammars), args.workers, args.lean)
+    try:
+        asyncio.run(parse_server.serve(args.unix, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        parse_server.close()
@@ -0,0 +1,167 @@
+import cProfile
+import pstats
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+from io import StringIO
+
+
+class Stats:
+    """
+    Instrumentation of grammar construction, SLR map construction and analysis.
+
+    Holds timing of every phase, counters of build and parse events, and an optional cProfile profiler.
+    One Stats instance is attached to every Grammar, shared by all project sets and the analyzer built on it.
+    """
+    def __init__(self, profile=False):
+        """
+        :param profile: bool, profile every phase with cProfile or not.
+        """
+        self.profile = profile
+        self.profiler = None
+
+        # Total seconds and call times of every phase, both in 'phase name -> value' format.
+        self.timings = dict()
+        self.phase_calls = Counter()
+
+        # Cumulative counters since creation or last reset.
+        self.counters = Counter()
+
+        # Counters of the last analysis only, like shifts, reductions, quads and temps.
+        self.last_parse = Counter()
+
+        # Depth of nested phases, so that the profiler is only enabled in the outermost one.
+        # Timings are recorded for every phase, so a nested phase's time is also part of its outer phase.
+        self.depth = 0
+
+    def __str__(self):
+        result = ['{:24}{:>8}{:>12}'.format('Phase', 'Calls', 'Time(ms)')]
+        for name, seconds in self.timings.items():
+            result.append('{:24}{:>8}{:>12.3f}'.format(name, self.phase_calls[name], seconds * 1000))
+        result.append('')
+        result.append('{:24}{:>8}'.format('Counter', 'Total'))
+        for name, value in sorted(self.counters.items()):
+            result.append('{:24}{:>8}'.format(name, value))
+        if len(self.last_parse) > 0:
+            result.append('')
+            result.append('{:24}{:>8}'.format('Last parse', ''))
+            for name, value in sorted(self.last_parse.items()):
+                result.append('{:24}{:>8}'.format(name, value))
+        return '\n'.join(result)
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Context manager timing one phase, like 'construct_first' or 'analysis'.
+
+        :param name: str, the phase name.
+        """
+        self.depth += 1
+        profiling = self.profile and self.depth == 1
+        if profiling:
+            if self.profiler is None:
+                self.profiler = cProfile.Profile()
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiling:
+                self.profiler.disable()
+            self.depth -= 1
+            self.timings[name] = self.timings.get(name, 0) + elapsed
+            self.phase_calls[name] += 1
+
+    def incr(self, name, n=1):
+        """
+        Increase a cumulative counter.
+
+        :param name: str, counter name, like 'closure_calls'.
+        :param n: int, the amount to increase.
+        """
+        self.counters[name] += n
+
+    def begin_parse(self):
+        """
+        Clear per-parse counters, called at the beginning of every analysis.
+        """
+        self.last_parse.clear()
+        self.counters['parses'] += 1
+
+    def incr_parse(self, name, n=1):
+        """
+        Increase a per-parse counter, together with its cumulative counter.
+
+        :param name: str, counter name, like 'shifts'.
+        :param n: int, the amount to increase.
+        """
+        self.last_parse[name] += n
+        self.counters[name] += n
+
+    def as_dict(self):
+        """
+        :return: dict, containing all timings in seconds, phase calls and counters.
+        """
+        return {
+            'timings': dict(self.timings),
+            'phase_calls': dict(self.phase_calls),
+            'counters': dict(self.counters),
+            'last_parse': dict(self.last_parse),
+        }
+
+    def reset(self):
+        """
+        Clear all timings, counters and profile data.
+        """
+        self.timings.clear()
+        self.phase_calls.clear()
+        self.counters.clear()
+        self.last_parse.clear()
+        self.profiler = None
+
+    def print_stats(self):
+        """
+        Print out all timings and counters.
+        """
+        print(str(self) + '\n')
+
+    def get_profile(self, sort='cumulative', limit=20):
+        """
+        :param sort: str, the pstats sort key.
+        :param limit: int, the max count of functions to show.
+        :return: str, formatted cProfile statistics, or empty string if nothing was profiled.
+        """
+        if self.profiler is None:
+            return ''
+        output = StringIO()
+        pstats.Stats(self.profiler, stream=output).sort_stats(sort).print_stats(limit)
+        return output.getvalue()
+
+
+def get_deep_size(obj, exclude=()):
+    """
+    Approximate memory size of an object together with everything it references.
+
+    :param obj: the object to measure.
+    :param exclude: iterable, objects not to be counted or walked into, like the shared Grammar object.
+    :return: int, size in bytes.
+    """
+    seen = set(id(o) for o in exclude)
+    size = 0
+    stack = [obj]
+    while len(stack) > 0:
+        o = stack.pop()
+        if id(o) in seen:
+            continue
+        seen.add(id(o))
+        size += sys.getsizeof(o)
+        if isinstance(o, dict):
+            stack.extend(o.keys())
+            stack.extend(o.values())
+        elif isinstance(o, (list, tuple, set, frozenset)):
+            stack.extend(o)
+        elif hasattr(o, '__dict__'):
+            stack.append(o.__dict__)
+    return size